@@ -10,14 +10,15 @@ from bpy.props import (
     FloatProperty,
     FloatVectorProperty,
     IntProperty,
+    IntVectorProperty,
     CollectionProperty,
 )
 from bpy.types import PropertyGroup
-from math import radians
-from mathutils import Vector, Quaternion
-from itertools import chain, zip_longest
+from bpy.app.handlers import persistent
+from itertools import zip_longest, compress
 import numpy as np
 import re
+import time
 
 bl_info = {
     "name": "Mr.GPen",
@@ -87,6 +88,14 @@ translation_dict = {
             "複数のレイヤーの名前を変更",
         ("*", "Rotate Points"):
             "点の位置を循環",
+        ("*", "Resample Strokes"):
+            "ストロークをリサンプル",
+        ("*", "Simplify Strokes"):
+            "ストロークを単純化",
+        ("*", "Clean Up Strokes"):
+            "重複した点と長さのないストロークを削除",
+        ("*", "Mixed"):
+            "バラバラ",
     },
     "en_US": {
         ("*", "Create New Layer"):
@@ -149,24 +158,44 @@ translation_dict = {
             "Rename Layers",
         ("*", "Rotate Points"):
             "Rotate Points",
+        ("*", "Resample Strokes"):
+            "Resample Strokes",
+        ("*", "Simplify Strokes"):
+            "Simplify Strokes",
+        ("*", "Clean Up Strokes"):
+            "Clean Up Strokes",
+        ("*", "Mixed"):
+            "Mixed",
     },
 }
 
+def get_material_locks(materials):
+    """マテリアルスロットごとの固定の状態を配列で返す"""
+    locks = np.zeros(len(materials), dtype=bool)
+
+    for i, x in enumerate(materials):
+        grease_pencil = x.grease_pencil if x else None
+        if grease_pencil:
+            locks[i] = grease_pencil.lock
+
+    return locks
+
+def get_material_lock_mask(material_locks, material_indices):
+    """ストロークのマテリアルが固定されているかどうかのマスクを返す"""
+    if len(material_locks) <= 0:
+        return np.zeros(len(material_indices), dtype=bool)
+
+    return material_locks[np.clip(material_indices, 0, len(material_locks) - 1)]
+
 def gen_strokes(layers):
     """全ストロークを返す"""
-    materials = layers.data.materials
-
-    yield from (
-        {
-            "layer": l,
-            "frame": l.active_frame,
-            "stroke": s,
-        }
-        for l in layers
-        if not l.lock
-        for s in l.active_frame.strokes
-        if not materials[s.material_index].grease_pencil.lock
-    )
+    for l, frame, stroke_mask in gen_frame_masks(layers):
+        for s in compress(frame.strokes, stroke_mask):
+            yield {
+                "layer": l,
+                "frame": frame,
+                "stroke": s,
+            }
 
 def gen_points(layers):
     """全ポイントを返す"""
@@ -179,25 +208,129 @@ def gen_points(layers):
         for p in s["stroke"].points
     )
 
+# 選択情報のキャッシュ(GreasePencilのポインタ -> 選択情報)
+selection_index_cache = {}
+
+# 選択情報を破棄した回数
+selection_generation = 0
+
+def invalidate_selection_index():
+    """選択情報のキャッシュを破棄する"""
+    global selection_generation
+
+    selection_index_cache.clear()
+    selection_generation += 1
+
+@persistent
+def on_data_update(*args):
+    """データが更新されたら選択情報のキャッシュを破棄する"""
+    invalidate_selection_index()
+
+def build_selection_index(layers):
+    """全レイヤーを1回だけ走査して選択情報を作成する"""
+    material_locks = get_material_locks(layers.data.materials)
+
+    entries = []
+    for li, l in enumerate(layers):
+        if l.lock:
+            # ロック中レイヤーは除外
+            continue
+
+        frame = l.active_frame
+        if not frame:
+            continue
+
+        strokes = frame.strokes
+        stroke_count = len(strokes)
+        if stroke_count <= 0:
+            continue
+
+        # ストロークの選択状態とマテリアルを一括で取得し、ロック中マテリアルは除外
+        material_indices = get_strokes_array(strokes, "material_index")
+        stroke_mask = get_strokes_array(strokes, "select")
+        stroke_mask &= ~get_material_lock_mask(material_locks, material_indices)
+
+        point_indices = []
+        for s in compress(strokes, stroke_mask):
+            # ポイントの選択状態を一括で取得
+            points = s.points
+            point_mask = np.zeros(len(points), dtype=bool)
+            points.foreach_get("select", point_mask)
+
+            point_indices.append(np.flatnonzero(point_mask))
+
+        if not point_indices:
+            continue
+
+        entries.append({
+            "index": li,
+            "stroke_count": stroke_count,
+            "stroke_mask": stroke_mask,
+            "point_indices": point_indices,
+            "point_count": sum(len(x) for x in point_indices),
+            "material_indices": set(np.unique(material_indices[stroke_mask]).tolist()),
+        })
+
+    return {
+        "layer_count": len(layers),
+        "entries": entries,
+        "point_count": sum(x["point_count"] for x in entries),
+        "material_indices": set().union(*(x["material_indices"] for x in entries)),
+    }
+
+def is_valid_selection_index(layers, index):
+    """選択情報が現在のレイヤー・ストロークの数と一致するかどうか"""
+    if index["layer_count"] != len(layers):
+        return False
+
+    for x in index["entries"]:
+        frame = layers[x["index"]].active_frame
+        if not frame or len(frame.strokes) != x["stroke_count"]:
+            return False
+
+    return True
+
+def get_selection_index(layers):
+    """キャッシュ済みの選択情報を返す"""
+    key = layers.data.as_pointer()
+
+    index = selection_index_cache.get(key)
+    if index is None or not is_valid_selection_index(layers, index):
+        index = build_selection_index(layers)
+        selection_index_cache[key] = index
+
+    return index
+
+def gen_selection(layers):
+    """選択中のストロークと選択中のポイントの番号を返す"""
+    for x in get_selection_index(layers)["entries"]:
+        layer = layers[x["index"]]
+        frame = layer.active_frame
+
+        strokes = compress(frame.strokes, x["stroke_mask"])
+        for stroke, point_indices in zip(strokes, x["point_indices"]):
+            yield layer, frame, stroke, point_indices
+
 def gen_selected_points(layers):
     """選択中のポイントを返す"""
-    yield from (
-        {
-            "point": p,
-            **s,
-        }
-        for s in gen_selected_strokes(layers)
-        for p in s["stroke"].points
-        if p.select
-    )
+    for layer, frame, stroke, point_indices in gen_selection(layers):
+        points = stroke.points
+        for i in point_indices:
+            yield {
+                "layer": layer,
+                "frame": frame,
+                "stroke": stroke,
+                "point": points[i],
+            }
 
 def gen_selected_strokes(layers):
     """選択中のストロークを返す"""
-    yield from (
-        s
-        for s in gen_strokes(layers)
-        if s["stroke"].select
-    )
+    for layer, frame, stroke, _ in gen_selection(layers):
+        yield {
+            "layer": layer,
+            "frame": frame,
+            "stroke": stroke,
+        }
 
 def get_selected_strokes(layers):
     """選択中のストロークのリストを返す"""
@@ -205,25 +338,683 @@ def get_selected_strokes(layers):
 
 def gen_selected_layers(layers):
     """選択中のストロークのレイヤーを返す"""
-    materials = layers.data.materials
+    for x in get_selection_index(layers)["entries"]:
+        yield layers[x["index"]]
+
+def get_selected_layer_mask(layers):
+    """選択中のストロークのレイヤーかどうかのマスクを返す
+
+    選択情報と一緒にキャッシュする
+    """
+    index = get_selection_index(layers)
+
+    if "layer_mask" not in index:
+        mask = np.zeros(index["layer_count"], dtype=bool)
+        mask[[x["index"] for x in index["entries"]]] = True
+        index["layer_mask"] = mask
+
+    return index["layer_mask"]
+
+def get_selected_layers(layers):
+    """選択中のレイヤーを返す"""
+    return {
+        l.info: l
+        for l in (
+            layers[x["index"]]
+            for x in get_selection_index(layers)["entries"]
+            if x["point_count"] > 0
+        )
+    }
+
+def has_selected_points(layers):
+    """選択中のポイントがあるかどうか"""
+    return get_selection_index(layers)["point_count"] > 0
+
+def get_selected_material_indices(layers):
+    """選択中のストロークのマテリアル番号を返す"""
+    return get_selection_index(layers)["material_indices"]
+
+# ポイントの属性の要素数と型
+point_attrs = {
+    "co": (3, np.float32),
+    "pressure": (1, np.float32),
+    "strength": (1, np.float32),
+    "vertex_color": (4, np.float32),
+    "select": (1, bool),
+    "uv_factor": (1, np.float32),
+    "uv_rotation": (1, np.float32),
+}
+
+# 配列で取得するポイントの属性
+default_point_attrs = ("co", "pressure", "strength", "vertex_color", "select")
+
+def get_points_array(strokes, names=default_point_attrs):
+    """ストロークのポイントの属性をforeach_getで連続した配列にして返す
+
+    offsetsはストロークごとのポイントの開始位置で、
+    i番目のストロークのポイントはoffsets[i]からoffsets[i + 1]まで
+    """
+    strokes = list(strokes)
+    points_list = [x.points for x in strokes]
+
+    counts = np.fromiter((len(x) for x in points_list), dtype=np.int64, count=len(points_list))
+    offsets = np.zeros(len(points_list) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    total = int(offsets[-1])
+    buffers = {
+        name: np.empty(total * point_attrs[name][0], dtype=point_attrs[name][1])
+        for name in names
+    }
+
+    for points, start, end in zip(points_list, offsets[:-1], offsets[1:]):
+        if start == end:
+            continue
+
+        for name, buffer in buffers.items():
+            size = point_attrs[name][0]
+            points.foreach_get(name, buffer[start * size:end * size])
+
+    arrays = {
+        "strokes": strokes,
+        "offsets": offsets,
+    }
+    for name, buffer in buffers.items():
+        size = point_attrs[name][0]
+        arrays[name] = buffer.reshape(-1, size) if size > 1 else buffer
+
+    return arrays
+
+def get_changed_strokes(offsets, old_values, new_values):
+    """値が変わったポイントを含むストロークの番号を返す"""
+    changed = old_values != new_values
+    if changed.ndim > 1:
+        changed = changed.any(axis=1)
+
+    changed_count = np.zeros(len(changed) + 1, dtype=np.int64)
+    np.cumsum(changed, out=changed_count[1:])
+
+    return np.flatnonzero(changed_count[offsets[1:]] > changed_count[offsets[:-1]])
+
+def set_points_array(arrays, name, values):
+    """配列の値をforeach_setでポイントに書き込む
+
+    値が変わったストロークだけ書き込み、書き込んだかどうかを返す
+    """
+    offsets = arrays["offsets"]
+    values = np.ascontiguousarray(values, dtype=point_attrs[name][1])
+
+    changed_strokes = get_changed_strokes(offsets, arrays[name], values)
+
+    flat_values = values.reshape(-1)
+    size = point_attrs[name][0]
+    strokes = arrays["strokes"]
+    for i in changed_strokes:
+        start = offsets[i] * size
+        end = offsets[i + 1] * size
+        strokes[i].points.foreach_set(name, flat_values[start:end])
+
+    arrays[name] = values
+
+    return len(changed_strokes) > 0
+
+# ストロークの属性の要素数と型
+stroke_attrs = {
+    "select": (1, bool),
+    "material_index": (1, np.int32),
+    "line_width": (1, np.int32),
+    "hardness": (1, np.float32),
+    "vertex_color_fill": (4, np.float32),
+    "draw_cyclic": (1, bool),
+    "uv_rotation": (1, np.float32),
+    "uv_scale": (1, np.float32),
+    "uv_translation": (2, np.float32),
+}
+
+def get_strokes_array(strokes, name):
+    """フレームの全ストロークの属性をforeach_getで配列にして返す"""
+    size, dtype = stroke_attrs[name]
+
+    buffer = np.empty(len(strokes) * size, dtype=dtype)
+    strokes.foreach_get(name, buffer)
+
+    return buffer.reshape(-1, size) if size > 1 else buffer
+
+def set_strokes_array(strokes, name, values):
+    """フレームの全ストロークの属性をforeach_setで書き込む"""
+    values = np.ascontiguousarray(values, dtype=stroke_attrs[name][1])
+    strokes.foreach_set(name, values.reshape(-1))
+
+def gen_selected_stroke_masks(layers):
+    """フレームごとに選択中のストロークのマスクを返す"""
+    for x in get_selection_index(layers)["entries"]:
+        layer = layers[x["index"]]
+
+        yield layer, layer.active_frame, x["stroke_mask"]
+
+def set_layers_select(layers, layer_mask, select, is_include_hidden_locked=True):
+    """対象のレイヤーの全フレームのストロークの選択状態をforeach_setでまとめて書き込む
+
+    ストロークの選択はポイントの選択も合わせて変更する
+    書き込んだフレームの数を返す
+    """
+    count = 0
+    for l in compress(layers, layer_mask):
+        if not is_include_hidden_locked and (l.hide or l.lock):
+            continue
+
+        for f in l.frames:
+            strokes = f.strokes
+            stroke_count = len(strokes)
+            if stroke_count <= 0:
+                continue
+
+            # 選択解除は選択中のストロークがないフレームを飛ばす
+            if not select and not get_strokes_array(strokes, "select").any():
+                continue
+
+            set_strokes_array(strokes, "select", np.full(stroke_count, select, dtype=bool))
+            count += 1
+
+    return count
+
+def get_random_colors(rng, count):
+    """ランダムな不透明の色の配列を返す"""
+    colors = np.ones((count, 4), dtype=np.float32)
+    colors[:, :3] = rng.random((count, 3))
+
+    return colors
+
+def get_stroke_distances(co, offsets):
+    """ポイントごとの始点からの距離と、ストロークごとの長さを返す"""
+    counts = np.diff(offsets)
+    is_filled = counts > 0
+    starts = offsets[:-1][is_filled]
+    ends = offsets[1:][is_filled] - 1
+
+    # 1つ前のポイントとの距離(始点は0)
+    segments = np.zeros(len(co))
+    if len(co) > 1:
+        segments[1:] = np.linalg.norm(np.diff(co.astype(np.float64), axis=0), axis=1)
+    segments[starts] = 0
+
+    # 全体の累積からストロークの始点までの累積を引く
+    distances = np.cumsum(segments)
+    distances -= np.repeat(distances[starts], counts[is_filled])
+
+    lengths = np.zeros(len(counts))
+    lengths[is_filled] = distances[ends]
+
+    return distances, lengths
+
+# リサンプルで補間するポイントの属性
+resample_point_attrs = ("co", "pressure", "strength", "vertex_color")
+
+def resample_points_array(arrays, counts, names=resample_point_attrs):
+    """ストロークを弧長で等間隔にcounts個のポイントにした属性の配列を返す
+
+    countsが2未満のストロークはポイントを作らない
+    """
+    offsets = arrays["offsets"]
+    old_counts = np.diff(offsets)
+    distances, lengths = get_stroke_distances(arrays["co"], offsets)
+
+    counts = np.where(counts >= 2, counts, 0)
+    new_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+
+    # ストロークをまたいで単調増加する弧長にする
+    stroke_starts = np.zeros(len(lengths))
+    np.cumsum(lengths[:-1] + 1, out=stroke_starts[1:])
+    keys = distances + np.repeat(stroke_starts, old_counts)
+
+    # 新しいポイントごとの弧長
+    stroke_indices = np.repeat(np.arange(len(counts)), counts)
+    local_indices = np.arange(int(new_offsets[-1])) - new_offsets[:-1][stroke_indices]
+    t = local_indices / np.maximum(counts - 1, 1)[stroke_indices]
+    targets = stroke_starts[stroke_indices] + t * lengths[stroke_indices]
+
+    # 補間する区間の前後のポイント
+    starts = offsets[:-1][stroke_indices]
+    ends = offsets[1:][stroke_indices] - 1
+    j = np.searchsorted(keys, targets, side="right") - 1
+    j = np.clip(j, starts, np.maximum(ends - 1, starts))
+    k = np.minimum(j + 1, ends)
+
+    span = keys[k] - keys[j]
+    f = np.zeros(len(targets))
+    np.divide(targets - keys[j], span, out=f, where=span > 0)
+    np.clip(f, 0, 1, out=f)
+
+    result = {"offsets": new_offsets}
+    for name in names:
+        values = arrays[name].astype(np.float64)
+        w = f[:, None] if values.ndim > 1 else f
+        result[name] = values[j] * (1 - w) + values[k] * w
+
+    return result
+
+def get_resample_errors(arrays, resampled):
+    """元のポイントとリサンプルしたストロークの同じ弧長の位置との距離の最大値を返す"""
+    offsets = arrays["offsets"]
+    old_counts = np.diff(offsets)
+    new_offsets = resampled["offsets"]
+    counts = np.diff(new_offsets)
+    distances, lengths = get_stroke_distances(arrays["co"], offsets)
+
+    errors = np.zeros(len(counts))
+
+    # リサンプルしたストロークのポイントだけ計算する
+    stroke_indices = np.repeat(np.arange(len(counts)), old_counts)
+    mask = (counts >= 2)[stroke_indices]
+    stroke_indices = stroke_indices[mask]
+    if len(stroke_indices) <= 0:
+        return errors
+
+    # 新しいポイントは弧長で等間隔なので、弧長の割合から位置を求める
+    stroke_lengths = lengths[stroke_indices]
+    u = np.zeros(len(stroke_indices))
+    np.divide(distances[mask], stroke_lengths, out=u, where=stroke_lengths > 0)
+
+    last = counts[stroke_indices] - 1
+    pos = u * last
+    i = np.clip(np.floor(pos).astype(np.int64), 0, last - 1)
+    f = np.clip(pos - i, 0, 1)[:, None]
+
+    base = new_offsets[:-1][stroke_indices]
+    co = resampled["co"]
+    co = co[base + i] * (1 - f) + co[base + i + 1] * f
+
+    np.maximum.at(errors, stroke_indices, np.linalg.norm(arrays["co"][mask] - co, axis=1))
+
+    return errors
+
+def get_resample_counts_by_error(arrays, error, counts):
+    """誤差がerror以下になるポイントの数を二分探索で返す
+
+    countsはリサンプルするストロークのポイントの数の上限で、2未満はリサンプルしない
+    上限でも誤差が収まらないストロークは0を返す
+    誤差はポイントの数に対して単調ではないので、最小の数になるとは限らない
+    """
+    is_target = counts >= 2
+
+    # 上限の数で誤差が収まらないストロークは探索しない
+    errors = get_resample_errors(arrays, resample_points_array(arrays, np.where(is_target, counts, 0), ("co",)))
+    is_target &= errors <= error
+
+    low = np.where(is_target, 1, 0)
+    high = np.where(is_target, counts, 0)
+
+    while True:
+        is_searching = high - low > 1
+        if not is_searching.any():
+            break
+
+        middle = np.where(is_searching, (low + high) // 2, 0)
+        errors = get_resample_errors(arrays, resample_points_array(arrays, middle, ("co",)))
+
+        is_ok = is_searching & (errors <= error)
+        high = np.where(is_ok, middle, high)
+        low = np.where(is_searching & ~is_ok, middle, low)
+
+    return high
+
+def get_stroke_normals(co, offsets):
+    """ビューポート上のポイントごとの接線に垂直な向き(XY平面)を返す"""
+    counts = np.diff(offsets)
+    indices = np.arange(len(co))
+    starts = np.repeat(offsets[:-1], counts)
+    ends = np.repeat(offsets[1:] - 1, counts)
+
+    # 前後のポイントから接線を求める(端のポイントは片側だけ)
+    tangents = (
+        co[np.minimum(indices + 1, ends), :2]
+        - co[np.maximum(indices - 1, starts), :2]
+    ).astype(np.float64)
+    lengths = np.linalg.norm(tangents, axis=1)
+
+    # 向きが決まらないポイントはX方向とする
+    is_zero = lengths <= 0
+    tangents[is_zero] = (1, 0)
+    lengths[is_zero] = 1
+    tangents /= lengths[:, None]
+
+    # 接線を90度回転させる
+    normals = np.zeros((len(co), 3))
+    normals[:, 0] = -tangents[:, 1]
+    normals[:, 1] = tangents[:, 0]
+
+    return normals
+
+def transform_points(matrix, co):
+    """行列でポイントの位置をまとめて変換する"""
+    m = np.array(matrix, dtype=np.float64)
+
+    return co @ m[:3, :3].T + m[:3, 3]
+
+def get_view_matrix(context, obj):
+    """オブジェクトの座標をビューポートの座標に変換する行列を返す
+
+    ビューポートがなければNoneを返す
+    """
+    spaces = [x for x in context.area.spaces if x.type == "VIEW_3D"]
+    if len(spaces) <= 0:
+        return None
+
+    return spaces[0].region_3d.view_matrix @ obj.matrix_world
+
+def get_simplify_mask(co, offsets, error):
+    """Ramer-Douglas-Peuckerで残すポイントのマスクを返す
+
+    全ストロークの区間を階層ごとにまとめて分割し、距離はXY平面で計算する
+    """
+    counts = np.diff(offsets)
+    keep = np.zeros(len(co), dtype=bool)
+
+    # 始点と終点は必ず残す
+    is_filled = counts > 0
+    keep[offsets[:-1][is_filled]] = True
+    keep[offsets[1:][is_filled] - 1] = True
+
+    co = co[:, :2].astype(np.float64)
+    starts = offsets[:-1][counts > 2]
+    ends = offsets[1:][counts > 2] - 1
+
+    while len(starts) > 0:
+        # 区間ごとの内側のポイント
+        inner_counts = ends - starts - 1
+        segment_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(inner_counts, out=segment_offsets[1:])
+
+        segments = np.repeat(np.arange(len(starts)), inner_counts)
+        indices = (
+            np.arange(int(segment_offsets[-1]))
+            - segment_offsets[:-1][segments]
+            + starts[segments] + 1
+        )
+
+        # 区間の両端を結ぶ線分との距離
+        a = co[starts][segments]
+        ab = (co[ends] - co[starts])[segments]
+        ap = co[indices] - a
+
+        ab_lengths = np.einsum("ij,ij->i", ab, ab)
+        t = np.zeros(len(indices))
+        np.divide(np.einsum("ij,ij->i", ap, ab), ab_lengths, out=t, where=ab_lengths > 0)
+        np.clip(t, 0, 1, out=t)
+        distances = np.linalg.norm(ap - ab * t[:, None], axis=1)
+
+        # 区間ごとに最も遠いポイント(同じ距離なら先のポイント)
+        max_distances = np.maximum.reduceat(distances, segment_offsets[:-1])
+        farthest = np.where(distances == max_distances[segments], indices, len(co))
+        farthest = np.minimum.reduceat(farthest, segment_offsets[:-1])
+
+        # 誤差より遠いポイントを残して区間を分割する
+        is_split = max_distances > error
+        farthest = farthest[is_split]
+        keep[farthest] = True
+
+        starts = np.concatenate([starts[is_split], farthest])
+        ends = np.concatenate([farthest, ends[is_split]])
+
+        is_inner = ends - starts > 1
+        starts = starts[is_inner]
+        ends = ends[is_inner]
+
+    return keep
+
+def get_removed_counts(offsets, keep):
+    """ストロークごとのkeepがFalseのポイントの数を返す"""
+    keep_count = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(keep, out=keep_count[1:])
+
+    return np.diff(offsets) - (keep_count[offsets[1:]] - keep_count[offsets[:-1]])
+
+def pop_points(points, arrays, start, end, mask):
+    """ストロークの末尾からポイントを1点ずつ削除し、残すポイントの属性を詰めて書き込む
+
+    pop()は1回ごとにポイントの配列を作り直すので、削除する数とポイントの数の積に比例して遅い
+    """
+    for _ in range(int(end - start - np.count_nonzero(mask))):
+        points.pop()
+
+    for name in (x for x in arrays if x in point_attrs):
+        values = np.ascontiguousarray(arrays[name][start:end][mask])
+        points.foreach_set(name, values.reshape(-1))
+
+def remove_points(context, frames):
+    """keepがFalseのポイントをストロークから削除し、フレームごとにストロークごとの削除した数を返す
+
+    framesは(ポイントの属性の配列, keep)のリストで、配列には"select"を含める
+    編集モードではgpencil.dissolveで全てのストロークを1回でまとめて縮め、
+    使えない場合や削除されなかったストロークは1点ずつpop()する
+    """
+    removed_counts_list = [get_removed_counts(arrays["offsets"], keep) for arrays, keep in frames]
+    if not any(x.any() for x in removed_counts_list):
+        return removed_counts_list
+
+    # 複数フレーム編集中は他のフレームの選択中のポイントも削除されるので使わない
+    is_dissolve = (
+        context.mode == "EDIT_GPENCIL"
+        and not context.active_object.data.use_multiedit
+        and bpy.ops.gpencil.dissolve.poll()
+    )
+
+    if is_dissolve:
+        # 削除するポイントだけを選択する
+        for (arrays, keep), removed_counts in zip(frames, removed_counts_list):
+            offsets = arrays["offsets"]
+            for stroke, start, end, count in zip(arrays["strokes"], offsets[:-1], offsets[1:], removed_counts):
+                # ストロークの選択はポイントも全て選択するので先に設定する
+                stroke.select = bool(count)
+                if count:
+                    stroke.points.foreach_set("select", ~keep[start:end])
+
+        bpy.ops.gpencil.dissolve(type="POINTS")
+
+    for (arrays, keep), removed_counts in zip(frames, removed_counts_list):
+        offsets = arrays["offsets"]
+        for stroke, start, end, count in zip(arrays["strokes"], offsets[:-1], offsets[1:], removed_counts):
+            points = stroke.points
+            mask = keep[start:end]
+
+            if count and len(points) == end - start:
+                # 削除されなかったストロークは1点ずつ削除する
+                pop_points(points, arrays, start, end, mask)
+            elif is_dissolve:
+                # 残ったポイントの選択状態を戻す
+                select = arrays["select"][start:end][mask]
+                stroke.select = bool(select.any())
+                points.foreach_set("select", select)
+
+    return removed_counts_list
+
+def get_duplicate_points_mask(co, offsets, distance=0):
+    """直前に残したポイントとの距離がdistance以下のポイントのマスクを返す
+
+    始点と終点は必ず残し、終点と重なるポイントは終点の手前のポイントを削除する
+    """
+    remove = np.zeros(len(co), dtype=bool)
+    if len(co) < 2:
+        return remove
+
+    co = co.astype(np.float64)
+
+    # 1つ前のポイントと近いポイント(ストロークの始点は前のストロークと比べない)
+    counts = np.diff(offsets)
+    is_filled = counts > 0
+    is_start = np.zeros(len(co), dtype=bool)
+    is_start[offsets[:-1][is_filled]] = True
+    is_end = np.zeros(len(co), dtype=bool)
+    is_end[offsets[1:][is_filled] - 1] = True
+
+    is_near = np.zeros(len(co), dtype=bool)
+    is_near[1:] = np.linalg.norm(np.diff(co, axis=0), axis=1) <= distance
+    is_near &= ~is_start
+
+    # 近いポイントが続く範囲だけ、直前に残したポイントからの距離で順に判定する
+    co_list = co.tolist()
+    is_near_list = is_near.tolist()
+    is_start_list = is_start.tolist()
+    is_end_list = is_end.tolist()
+    remove_list = remove.tolist()
+    limit = distance ** 2
+
+    position = 0
+    for i in np.flatnonzero(is_near).tolist():
+        if i < position:
+            continue
+
+        anchor = i - 1
+        j = i
+        while True:
+            d = sum((a - b) ** 2 for a, b in zip(co_list[j], co_list[anchor]))
+            if is_end_list[j]:
+                # 終点は残し、重なる手前のポイントを削除する
+                if d <= limit and not is_start_list[anchor]:
+                    remove_list[anchor] = True
+                break
+
+            if d <= limit:
+                remove_list[j] = True
+            else:
+                anchor = j
+
+            j += 1
+            if not (is_near_list[j] or remove_list[j - 1]):
+                break
+
+        position = j + 1
+
+    return np.array(remove_list, dtype=bool)
+
+def add_stroke(frame, points_arrays):
+    """ポイントの属性の配列から新しいストロークを作成する"""
+    stroke = frame.strokes.new()
+
+    points = stroke.points
+    points.add(len(points_arrays["co"]))
+    for name, values in points_arrays.items():
+        values = np.ascontiguousarray(values, dtype=point_attrs[name][1])
+        points.foreach_set(name, values.reshape(-1))
+
+    return stroke
+
+def gen_frame_masks(layers):
+    """フレームごとに対象のストロークのマスクを返す"""
+    material_locks = get_material_locks(layers.data.materials)
 
     for l in layers:
         if l.lock:
-            # ロック中レイヤーは除外
             continue
 
-        g = (
-            s
-            for s in l.active_frame.strokes
-            if s.select and not materials[s.material_index].grease_pencil.lock
-        )
-        for s in g:
-            yield l
-            break
+        frame = l.active_frame
+        if not frame:
+            continue
 
-def get_selected_layers(layers):
-    """選択中のレイヤーを返す"""
-    return {x["layer"].info: x["layer"] for x in gen_selected_points(layers)}
+        # ロック中マテリアルのストロークは除外
+        material_indices = get_strokes_array(frame.strokes, "material_index")
+        stroke_mask = ~get_material_lock_mask(material_locks, material_indices)
+
+        yield l, frame, stroke_mask
+
+def gen_frames(layers):
+    """フレームごとに全ストロークを返す"""
+    for l, frame, stroke_mask in gen_frame_masks(layers):
+        yield l, frame, list(compress(frame.strokes, stroke_mask))
+
+def set_points_select(arrays, values):
+    """ポイントの選択状態を書き込み、ストロークの選択状態も合わせる"""
+    offsets = arrays["offsets"]
+    values = np.ascontiguousarray(values, dtype=bool)
+
+    strokes = arrays["strokes"]
+    for i in get_changed_strokes(offsets, arrays["select"], values):
+        select = values[offsets[i]:offsets[i + 1]]
+
+        # ストロークの選択はポイントも全て選択するので先に設定する
+        stroke = strokes[i]
+        stroke.select = bool(select.any())
+        stroke.points.foreach_set("select", select)
+
+    arrays["select"] = values
+
+def gen_selected_frames(layers):
+    """フレームごとに選択中のストロークを返す"""
+    for x in get_selection_index(layers)["entries"]:
+        layer = layers[x["index"]]
+        frame = layer.active_frame
+
+        yield layer, frame, list(compress(frame.strokes, x["stroke_mask"]))
+
+def gen_points_arrays(layers, names=default_point_attrs):
+    """フレームごとに全ポイントの属性の配列を返す"""
+    for layer, frame, strokes in gen_frames(layers):
+        yield layer, frame, get_points_array(strokes, names)
+
+def gen_selected_points_arrays(layers, names=default_point_attrs):
+    """フレームごとに選択中のストロークのポイントの属性の配列を返す
+
+    選択中のポイントだけを使う場合はselectでマスクする
+    """
+    for layer, frame, strokes in gen_selected_frames(layers):
+        yield layer, frame, get_points_array(strokes, names)
+
+# 色の距離を一度に計算する要素数の上限
+nearest_color_chunk_size = 1 << 20
+
+# 色の距離を計算する色空間
+color_space_list = [
+    ("RGB", "RGB", ""),
+    ("OKLAB", "OKLab", ""),
+]
+
+def convert_color_space(colors, color_space):
+    """RGBAの配列を距離を計算する色空間に変換する"""
+    if color_space == "OKLAB":
+        return np.hstack([rgb_to_oklab(colors), colors[:, 3:]])
+
+    return colors
+
+def get_nearest_color_mask(colors, selected_colors, threshold, color_space="RGB"):
+    """選択中の色のどれかとの距離がしきい値以下の色のマスクを返す
+
+    距離は色空間に変換した色とアルファのベクトルの長さの半分
+    """
+    mask = np.zeros(len(colors), dtype=bool)
+    if len(colors) <= 0 or len(selected_colors) <= 0 or threshold < 0:
+        return mask
+
+    # 同じ色はまとめて計算する
+    unique_colors, inverse = np.unique(colors, axis=0, return_inverse=True)
+    unique_colors = convert_color_space(unique_colors.astype(np.float64), color_space)
+    selected_colors = convert_color_space(np.asarray(selected_colors, dtype=np.float64), color_space)
+
+    limit = (threshold * 2) ** 2
+    unique_mask = np.zeros(len(unique_colors), dtype=bool)
+
+    chunk_size = max(1, nearest_color_chunk_size // len(selected_colors))
+    for i in range(0, len(unique_colors), chunk_size):
+        d = unique_colors[i:i + chunk_size, None, :] - selected_colors[None, :, :]
+        unique_mask[i:i + chunk_size] = (np.einsum("ijk,ijk->ij", d, d) <= limit).any(axis=1)
+
+    return unique_mask[inverse.reshape(-1)]
+
+def find_curve(name):
+    """Node Groupに作成済みのCurve Nodeを返す(なければNone)"""
+    node_group = bpy.data.node_groups.get("MRGPEN_NODE_{}".format(name))
+    if not node_group or len(node_group.nodes) <= 0:
+        return None
+
+    return node_group.nodes[0]
+
+# パネルで使うカーブの名前
+curve_names = ("ENTRY_AND_EXIT", "FAT_STROKE")
+
+def ensure_curves():
+    """パネルで使うCurve Nodeを作成する"""
+    for x in curve_names:
+        get_curve(x)
 
 def get_curve(name):
     """Node Groupに作成したCurve Nodeを返す"""
@@ -242,13 +1033,60 @@ def get_curve(name):
     node = None
     if len(nodes) <= 0:
         node = nodes.new(type="CompositorNodeCurveRGB")
+        node.mapping.initialize()
     else:
         node = nodes[0]
 
-    node.mapping.initialize()
-
     return node
 
+# カーブをサンプルする数
+curve_lut_resolution = 256
+
+# カーブをサンプルした値のキャッシュ(名前 -> (カーブの状態, サンプルした値))
+curve_lut_cache = {}
+
+def get_curve_signature(mapping, curve):
+    """カーブが編集されたかどうかを判定するための値を返す"""
+    return (
+        mapping.extend,
+        mapping.use_clip,
+        mapping.clip_min_x,
+        mapping.clip_min_y,
+        mapping.clip_max_x,
+        mapping.clip_max_y,
+        tuple((tuple(x.location), x.handle_type) for x in curve.points),
+    )
+
+def get_curve_lut(name):
+    """Curve Nodeのカーブを一定の間隔でサンプルした値を返す
+
+    カーブが編集されるまではキャッシュした値を返す
+    """
+    mapping = get_curve(name).mapping
+    if len(mapping.curves) <= 0:
+        return None
+
+    curve = mapping.curves[-1]
+    signature = get_curve_signature(mapping, curve)
+
+    cache = curve_lut_cache.get(name)
+    if cache and cache[0] == signature:
+        return cache[1]
+
+    mapping.initialize()
+    lut = np.array([
+        mapping.evaluate(curve, x)
+        for x in np.linspace(0, 1, curve_lut_resolution)
+    ])
+
+    curve_lut_cache[name] = (signature, lut)
+
+    return lut
+
+def evaluate_curve_lut(lut, t):
+    """サンプルした値からカーブの値を補間して返す"""
+    return np.interp(t, np.linspace(0, 1, len(lut)), lut)
+
 def rgb_to_srgb(rgb):
     """RGBからsRGBに変換する"""
     return [
@@ -263,21 +1101,90 @@ def srgb_to_rgb(srgb):
         for v in list(srgb)[:3]
     ]
 
+def rgb_to_oklab(rgb):
+    """RGBの配列からOKLabの配列に変換する"""
+    rgb = np.asarray(rgb, dtype=np.float64)[:, :3]
+
+    lms = rgb @ np.array([
+        [0.4122214708, 0.2119034982, 0.0883024619],
+        [0.5363325363, 0.6806995451, 0.2817188376],
+        [0.0514459929, 0.1073969566, 0.6299787005],
+    ])
+
+    return np.cbrt(lms) @ np.array([
+        [0.2104542553, 1.9779984951, 0.0259040371],
+        [0.7936177850, -2.4285922050, 0.7827717662],
+        [-0.0040720468, 0.4505937099, -0.8086757660],
+    ])
+
+
+# コンパイル済みの正規表現のキャッシュ(正規表現 -> match、不正な正規表現はNone)
+filter_regex_cache = {}
+
+# レイヤー名のキャッシュ(GreasePencilのポインタ -> (選択情報を破棄した回数, レイヤー名))
+layer_names_cache = {}
+
+# レイヤーフィルターの一致結果のキャッシュ((正規表現, レイヤー名) -> マスク)
+filter_mask_cache = {}
+
+# 一致結果をキャッシュする数の上限
+filter_mask_cache_size = 256
+
+def compile_filter(regex):
+    """キャッシュ済みのコンパイルした正規表現のmatchを返す"""
+    if regex not in filter_regex_cache:
+        try:
+            filter_regex_cache[regex] = re.compile(regex).match
+        except:
+            filter_regex_cache[regex] = None
+
+    return filter_regex_cache[regex]
+
+def get_layer_names(layers):
+    """キャッシュ済みの全レイヤー名を返す
+
+    レイヤー名の変更・追加・削除はデータの更新で選択情報と一緒に破棄される
+    """
+    key = layers.data.as_pointer()
+
+    cache = layer_names_cache.get(key)
+    if cache and cache[0] == selection_generation and len(cache[1]) == len(layers):
+        return cache[1]
+
+    names = tuple(x.info for x in layers)
+    layer_names_cache[key] = (selection_generation, names)
+
+    return names
+
+def get_filter_mask(layers, regex):
+    """レイヤー名が正規表現に一致するかどうかのマスクを返す
+
+    不正な正規表現の場合は全て一致とする
+    """
+    names = get_layer_names(layers)
+    key = (regex, names)
+
+    mask = filter_mask_cache.get(key)
+    if mask is None:
+        re_match = compile_filter(regex)
+        if re_match is None:
+            mask = np.ones(len(names), dtype=bool)
+        else:
+            mask = np.fromiter(
+                (re_match(x) is not None for x in names),
+                dtype=bool,
+                count=len(names),
+            )
+
+        if len(filter_mask_cache) >= filter_mask_cache_size:
+            filter_mask_cache.clear()
+        filter_mask_cache[key] = mask
+
+    return mask
 
 def filter_layers(layers, regex):
     """レイヤーをフィルタリングする"""
-    try:
-        # 選択中のフィルター設定でフィルタリング
-        re_match = re.compile(regex).match
-        filtered_layers = (
-            x
-            for x in layers
-            if re_match(x.info)
-        )
-    except:
-        filtered_layers = iter(layers)
-
-    yield from filtered_layers
+    yield from compress(layers, get_filter_mask(layers, regex))
 
 
 class MRGPEN_UL_layer_filters(bpy.types.UIList):
@@ -300,9 +1207,12 @@ class MRGPEN_UL_layer_filters(bpy.types.UIList):
             layers = data.layers
             regex = item.regex
 
+            # フィルターに一致するレイヤーは一度だけ取得する
+            filtered_layers = list(filter_layers(layers, regex))
+
             # フィルターごとに表示・非表示を切り替えるボタン
             def c(method, key, icon_on, icon_off):
-                value = all(getattr(x, key) for x in filter_layers(layers, regex))
+                value = all(getattr(x, key) for x in filtered_layers)
                 elm = row2.operator(
                     MRGPEN_OT_edit_layer_or_material.bl_idname,
                     icon=icon_on if value else icon_off,
@@ -380,15 +1290,14 @@ class MRGPEN_UL_layer_list(bpy.types.UIList):
         else:
             result_list = [bitflag_filter_item] * len(data_list)
 
-        try:
-            # 選択中のフィルター設定でフィルタリング
-            re_match = re.compile(data.mrgpen.layer_filter.regex).match
+        # 選択中のフィルター設定でフィルタリング
+        layer_filter = data.mrgpen.layer_filter
+        if layer_filter:
+            filter_mask = get_filter_mask(data_list, layer_filter.regex)
             result_list = [
-                y and (bitflag_filter_item if re_match(x.info) else 0)
-                for x, y in zip(data_list, result_list)
+                y and (bitflag_filter_item if x else 0)
+                for x, y in zip(filter_mask, result_list)
             ]
-        except:
-            pass
 
         return result_list, []
 
@@ -436,11 +1345,11 @@ class MRGPEN_UL_selected_stroke_layer_list(bpy.types.UIList):
         else:
             result_list = [bitflag_filter_item] * len(data_list)
 
-        # 選択中のフィルター設定でフィルタリング
-        selected_layer_set = {x.info for x in gen_selected_layers(data_list)}
+        # 選択中のストロークのレイヤーでフィルタリング
+        selected_layer_mask = get_selected_layer_mask(data_list)
         result_list = [
-            y and (bitflag_filter_item if x.info in selected_layer_set else 0)
-            for x, y in zip(data_list, result_list)
+            y and (bitflag_filter_item if x else 0)
+            for x, y in zip(selected_layer_mask, result_list)
         ]
 
         return result_list, []
@@ -474,9 +1383,12 @@ class MRGPEN_OT_select_layer(bpy.types.Operator):
 
 
 class MRGPEN_OT_select_same_layer_stroke(bpy.types.Operator):
-    """選択中のストロークと同じレイヤーのストロークを全て選択する"""
+    """選択中のストロークと同じレイヤーの全フレームのストロークを全て選択する"""
     bl_idname = "mrgpen.select_same_layer_stroke"
     bl_label = "Select_Same_Layer_Stroke"
+    bl_options = {"REGISTER", "UNDO"}
+
+    is_include_hidden_locked: BoolProperty(name="Include Hidden/Locked", default=True)
 
     def execute(self, context):
         obj = context.active_object
@@ -488,16 +1400,13 @@ class MRGPEN_OT_select_same_layer_stroke(bpy.types.Operator):
 
         layers = data.layers
 
-        for selected_stroke in gen_selected_strokes(layers):
-            strokes = (
-                s
-                for f in selected_stroke['layer'].frames
-                for s in f.strokes
-            )
-            for s in strokes:
-                s.select = True
+        # 選択中のストロークがある全てのレイヤーが対象
+        layer_mask = get_selected_layer_mask(layers).copy()
 
-            break
+        if set_layers_select(layers, layer_mask, True, self.is_include_hidden_locked):
+            data.update_tag()
+
+        invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -682,8 +1591,7 @@ class MRGPEN_OT_toggle_hide_material(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
-        selected_stroke_list = [x["stroke"] for x in gen_selected_strokes(layers)]
-        selected_material_index_list = list({x.material_index for x in selected_stroke_list})
+        selected_material_index_list = list(get_selected_material_indices(layers))
 
         material_slots = obj.material_slots
 
@@ -710,8 +1618,7 @@ class MRGPEN_OT_toggle_hide_material_other(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
-        selected_stroke_list = [x["stroke"] for x in gen_selected_strokes(layers)]
-        selected_material_index_sets = {x.material_index for x in selected_stroke_list}
+        selected_material_index_sets = get_selected_material_indices(layers)
 
         material_slots = obj.material_slots
 
@@ -748,8 +1655,7 @@ class MRGPEN_OT_toggle_lock_material(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
-        selected_stroke_list = [x["stroke"] for x in gen_selected_strokes(layers)]
-        selected_material_index_list = list({x.material_index for x in selected_stroke_list})
+        selected_material_index_list = list(get_selected_material_indices(layers))
 
         material_slots = obj.material_slots
 
@@ -776,8 +1682,7 @@ class MRGPEN_OT_toggle_lock_material_other(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
-        selected_stroke_list = [x["stroke"] for x in gen_selected_strokes(layers)]
-        selected_material_index_sets = {x.material_index for x in selected_stroke_list}
+        selected_material_index_sets = get_selected_material_indices(layers)
 
         material_slots = obj.material_slots
 
@@ -814,10 +1719,44 @@ class MRGPEN_OT_move_active_layer(bpy.types.Operator):
             return {'FINISHED'}
 
         bpy.ops.gpencil.move_to_layer(layer=data.layers.active_index)
+        invalidate_selection_index()
 
         return {'FINISHED'}
 
 
+def set_mask_layers(layer, layers, names, invert_names, is_invert):
+    """レイヤーのマスクを名前のリストのとおりにする
+
+    不要なマスクと重複したマスクを削除してから、足りないマスクを追加する
+    invert_namesのマスクは反転を設定する
+    """
+    mask_layers = layer.mask_layers
+    target_names = set(names)
+
+    # 不要なマスクを削除
+    current_names = set()
+    for x in list(mask_layers):
+        name = x.name
+        if name not in target_names or name in current_names:
+            mask_layers.remove(x)
+        else:
+            current_names.add(name)
+
+    # 足りないマスクを追加
+    for name in names:
+        if name in current_names:
+            continue
+
+        mask_layers.add(layers[name])
+        mask_layers[-1].invert = is_invert
+        current_names.add(name)
+
+    # 既にあったマスクの反転を設定
+    for name in invert_names:
+        if name in target_names:
+            mask_layers[name].invert = is_invert
+
+
 class MRGPEN_OT_mask_layer(bpy.types.Operator):
     """アクティブレイヤーのマスクに選択中のストロークのレイヤーを追加する"""
     bl_idname = "mrgpen.mask_layer"
@@ -839,6 +1778,14 @@ class MRGPEN_OT_mask_layer(bpy.types.Operator):
         name="Invert",
         default=False,
     )
+    target: EnumProperty(
+        name="Target",
+        default="ACTIVE",
+        items=[
+            ("ACTIVE", "Active Layer", ""),
+            ("LAYER_FILTER", "Layer Filter", ""),
+        ],
+    )
 
     def execute(self, context):
         obj = context.active_object
@@ -850,32 +1797,51 @@ class MRGPEN_OT_mask_layer(bpy.types.Operator):
 
         layers = data.layers
 
-        if not layers.active:
+        # マスクを設定するレイヤーを取得
+        target_layers = []
+        if self.target == "ACTIVE":
+            if layers.active:
+                target_layers = [layers.active]
+        elif self.target == "LAYER_FILTER":
+            target_layers = data.mrgpen.active_filtered_layers
+
+        if not target_layers:
             return {"FINISHED"}
 
         is_add = self.method == "ADD"
-        active = layers.active
-        mask_layers = active.mask_layers
+        is_init = self.is_init
         is_invert = self.is_invert
 
-        # マスクを有効化
-        active.use_mask_layer = True
+        # 選択中のストロークのレイヤー名
+        selected_names = list(get_selected_layers(layers))
+        selected_name_set = set(selected_names)
+
+        for l in target_layers:
+            info = l.info
+
+            # マスクを有効化
+            l.use_mask_layer = True
 
-        # マスクを初期化
-        if self.is_init:
-            for x in mask_layers:
-                mask_layers.remove(x)
+            # 初期化しない場合は今のマスクから変更する
+            names = []
+            if not is_init:
+                names = list(dict.fromkeys(x.name for x in l.mask_layers))
 
-        # 選択中のストロークのレイヤーを全てマスクに追加
-        for x in get_selected_layers(layers).values():
             if is_add:
-                mask_layers.add(x)
-                l = mask_layers[-1]
-                l.invert = is_invert
+                # 選択中のストロークのレイヤーを全てマスクに追加
+                name_set = set(names)
+                names += [
+                    x
+                    for x in selected_names
+                    if x not in name_set and x != info
+                ]
+                invert_names = selected_names
             else:
-                info = x.info
-                while info in mask_layers:
-                    mask_layers.remove(mask_layers[x.info])
+                # 選択中のストロークのレイヤーを全てマスクから削除
+                names = [x for x in names if x not in selected_name_set]
+                invert_names = []
+
+            set_mask_layers(l, layers, names, invert_names, is_invert)
 
         return {'FINISHED'}
 
@@ -939,6 +1905,7 @@ class MRGPEN_OT_add_new_layer(bpy.types.Operator):
 
         # 新規レイヤー作成
         layers.new(name=old_note)
+        invalidate_selection_index()
 
         new_active = layers.active
 
@@ -954,6 +1921,7 @@ class MRGPEN_OT_add_new_layer(bpy.types.Operator):
         # アクティブレイヤーの下に移動
         if self.position == "DOWN":
             ops.gpencil.layer_move(type="DOWN")
+            invalidate_selection_index()
 
         # 選択中のストロークのレイヤーでマスク
         if self.is_mask:
@@ -964,6 +1932,7 @@ class MRGPEN_OT_add_new_layer(bpy.types.Operator):
             ops.gpencil.move_to_layer(
                 layer=layers.active_index
             )
+            invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -1006,7 +1975,7 @@ class MRGPEN_OT_remove_stroke_layers(bpy.types.Operator):
 
         target_layers = None
         if self.target == "STROKE":
-            target_layers = gen_selected_layers(layers)
+            target_layers = list(gen_selected_layers(layers))
         elif self.target == "EMPTY":
             target_layers = (x for x in layers if sum(len(y.strokes) for y in x.frames) <= 0)
         elif self.target == "LAYER_FILTER":
@@ -1021,6 +1990,7 @@ class MRGPEN_OT_remove_stroke_layers(bpy.types.Operator):
             layers.remove(l)
 
         layers.update()
+        invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -1042,7 +2012,17 @@ class MRGPEN_OT_set_random_tint_color(bpy.types.Operator):
         ],
     )
     is_individual: BoolProperty(name="Individual", default=False)
+    group: EnumProperty(
+        name="Group",
+        default="STROKE",
+        items=[
+            ("STROKE", "Stroke", ""),
+            ("LAYER", "Layer", ""),
+            ("MATERIAL", "Material", ""),
+        ],
+    )
     is_same_stroke_fill: BoolProperty(name="Same Color", default=False)
+    seed: IntProperty(name="Seed", default=0, min=0, options={"SKIP_SAVE"})
 
     def execute(self, context):
         obj = context.active_object
@@ -1052,40 +2032,78 @@ class MRGPEN_OT_set_random_tint_color(bpy.types.Operator):
         if not obj and obj.type == "GPENCIL":
             return {'FINISHED'}
 
+        # 実行するたびに違う色にし、やり直しでは同じ色にする
+        if not self.properties.is_property_set("seed"):
+            self.seed = int(random() * (1 << 31))
+
         layers = data.layers
+        rng = np.random.default_rng(self.seed)
 
-        # 塗りつぶし色
-        vertex_color_fill = None
-        if self.is_individual:
-            vertex_color_fill = lambda: (random(), random(), random(), 1)
+        # 設定対象のフレームとストロークのマスクを取得
+        target_frames = []
+        target = self.target
+        if target == "SELECTED_STROKE":
+            target_frames = [(f, m) for _, f, m in gen_selected_stroke_masks(layers)]
         else:
-            c = (random(), random(), random(), 1)
-            vertex_color_fill = lambda: c
+            target_layers = []
+            if target == "SELECTED_STROKE_LAYER":
+                target_layers = list(gen_selected_layers(layers))
+            elif target == "ACTIVE_LAYER":
+                target_layers = [layers.active] if layers.active else []
+            elif target == "LAYER_FILTER":
+                target_layers = list(data.mrgpen.active_filtered_layers)
+
+            target_frames = [
+                (l.active_frame, np.ones(len(l.active_frame.strokes), dtype=bool))
+                for l in target_layers
+                if l.active_frame
+            ]
 
-        # 線色
-        vertex_color = None
-        if self.is_same_stroke_fill:
-            vertex_color = vertex_color_fill
-        else:
-            vertex_color = lambda: (random(), random(), random(), 1)
-
-        # 設定対象のストロークを取得
-        target_strokes = []
-        if self.target == "SELECTED_STROKE":
-            target_strokes = (x["stroke"] for x in gen_selected_strokes(layers))
-        elif self.target == "SELECTED_STROKE_LAYER":
-            target_strokes = (y for x in gen_selected_layers(layers) for y in x.active_frame.strokes)
-        elif self.target == "ACTIVE_LAYER":
-            target_strokes = layers.active.active_frame.strokes
-        elif self.target == "LAYER_FILTER":
-            target_strokes = (y for x in data.mrgpen.active_filtered_layers for y in x.active_frame.strokes)
+        # 塗りつぶし色はグループごとに同じ色にする
+        group = self.group if self.is_individual else "ALL"
+        group_colors = None
+        if group == "ALL":
+            group_colors = get_random_colors(rng, 1)
+        elif group == "LAYER":
+            group_colors = get_random_colors(rng, len(target_frames))
+        elif group == "MATERIAL":
+            group_colors = get_random_colors(rng, max(1, len(data.materials)))
+
+        for i, (frame, stroke_mask) in enumerate(target_frames):
+            count = int(np.count_nonzero(stroke_mask))
+            if count <= 0:
+                continue
+
+            strokes = frame.strokes
+
+            # 塗りつぶし色
+            colors = None
+            if group == "STROKE":
+                colors = get_random_colors(rng, count)
+            elif group == "LAYER":
+                colors = np.repeat(group_colors[i:i + 1], count, axis=0)
+            elif group == "MATERIAL":
+                material_indices = get_strokes_array(strokes, "material_index")[stroke_mask]
+                colors = group_colors[np.clip(material_indices, 0, len(group_colors) - 1)]
+            else:
+                colors = np.repeat(group_colors, count, axis=0)
 
-        # 色をストロークに設定
-        for x in target_strokes:
-            x.vertex_color_fill = vertex_color_fill()
+            vertex_color_fill = get_strokes_array(strokes, "vertex_color_fill")
+            vertex_color_fill[stroke_mask] = colors
+            set_strokes_array(strokes, "vertex_color_fill", vertex_color_fill)
 
-            for y in x.points:
-                y.vertex_color = vertex_color()
+            # 線色
+            arrays = get_points_array(compress(strokes, stroke_mask), ("vertex_color",))
+            point_colors = None
+            if self.is_same_stroke_fill:
+                point_colors = np.repeat(colors, np.diff(arrays["offsets"]), axis=0)
+            else:
+                point_colors = get_random_colors(rng, len(arrays["vertex_color"]))
+
+            set_points_array(arrays, "vertex_color", point_colors)
+
+        invalidate_selection_index()
+        data.update_tag()
 
         return {'FINISHED'}
 
@@ -1159,6 +2177,9 @@ class MRGPEN_OT_deselect_all_strokes(bpy.types.Operator):
     """非表示・固定も含めた全てのストロークの選択を解除する"""
     bl_idname = "mrgpen.deselect_all_strokes"
     bl_label = "Deselect All Strokes"
+    bl_options = {"REGISTER", "UNDO"}
+
+    is_include_hidden_locked: BoolProperty(name="Include Hidden/Locked", default=True)
 
     def execute(self, context):
         obj = context.active_object
@@ -1170,9 +2191,13 @@ class MRGPEN_OT_deselect_all_strokes(bpy.types.Operator):
 
         layers = data.layers
 
-        # 選択中レイヤーを非選択にする
-        for x in gen_selected_strokes(layers):
-            x["stroke"].select = False
+        # 全レイヤーの全フレームのストロークを非選択にする
+        layer_mask = np.ones(len(layers), dtype=bool)
+
+        if set_layers_select(layers, layer_mask, False, self.is_include_hidden_locked):
+            data.update_tag()
+
+        invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -1198,6 +2223,11 @@ class MRGPEN_OT_select_nearest_color(bpy.types.Operator):
         ],
     )
     threshold: FloatProperty(default=.01,)
+    color_space: EnumProperty(
+        name="Color Space",
+        default="RGB",
+        items=color_space_list,
+    )
 
     def execute(self, context):
         obj = context.active_object
@@ -1208,36 +2238,60 @@ class MRGPEN_OT_select_nearest_color(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
+        threshold = self.threshold
+        color_space = self.color_space
+        is_type = self.type == "SELECT"
 
-        # 全ストロークと、選択中のストロークの色を取得
-        targets = None
-        selected_colors = None
         if self.target == "FILL":
             # 塗りつぶし
-            targets = ((x["stroke"], x["stroke"].vertex_color_fill) for x in gen_strokes(layers))
-            selected_colors = (x["stroke"].vertex_color_fill for x in gen_selected_strokes(layers))
+            selected_colors = [
+                get_strokes_array(frame.strokes, "vertex_color_fill")[stroke_mask]
+                for _, frame, stroke_mask in gen_selected_stroke_masks(layers)
+            ]
+            if not selected_colors:
+                return {'FINISHED'}
+
+            selected_colors = np.unique(np.concatenate(selected_colors), axis=0)
+
+            is_changed = False
+            for _, frame, stroke_mask in gen_frame_masks(layers):
+                strokes = frame.strokes
+
+                # しきい値より近い色だけを選択・非選択状態にする
+                colors = get_strokes_array(strokes, "vertex_color_fill")
+                nearest_mask = stroke_mask & get_nearest_color_mask(colors, selected_colors, threshold, color_space)
+
+                select = get_strokes_array(strokes, "select")
+                new_select = select.copy()
+                new_select[nearest_mask] = is_type
+
+                if not np.array_equal(select, new_select):
+                    set_strokes_array(strokes, "select", new_select)
+                    is_changed = True
+
+            if is_changed:
+                data.update_tag()
         else:
             # 線
-            targets = ((x["point"], x["point"].vertex_color) for x in gen_points(layers))
-            selected_colors = (x["point"].vertex_color for x in gen_selected_points(layers))
+            selected_colors = [
+                arrays["vertex_color"][arrays["select"]]
+                for _, _, arrays in gen_selected_points_arrays(layers, ("vertex_color", "select"))
+            ]
+            if not selected_colors:
+                return {'FINISHED'}
 
-        # 各色をベクトルに変換する
-        targets = ((t, Vector(x)) for t, x in targets)
-        selected_colors = tuple(Vector(y) for y in {tuple(x) for x in selected_colors})
+            selected_colors = np.unique(np.concatenate(selected_colors), axis=0)
 
-        # しきい値より近い色だけを取得
-        threshold = self.threshold
-        nearest_color_targets = (
-            target
-            for target, color in targets
-            for selected_color in selected_colors
-            if (color - selected_color).length / 2 <= threshold
-        )
+            for _, _, arrays in gen_points_arrays(layers, ("vertex_color", "select")):
+                # しきい値より近い色だけを選択・非選択状態にする
+                nearest_mask = get_nearest_color_mask(arrays["vertex_color"], selected_colors, threshold, color_space)
 
-        # 選択したストロークを選択・非選択状態にする
-        is_type = self.type == "SELECT"
-        for target in nearest_color_targets:
-            target.select = is_type
+                new_select = arrays["select"].copy()
+                new_select[nearest_mask] = is_type
+
+                set_points_select(arrays, new_select)
+
+        invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -1272,63 +2326,58 @@ class MRGPEN_OT_fade_stroke_edge(bpy.types.Operator):
 
         layers = data.layers
         length = self.length
-
-        # 線の太さを初期化
-        if self.is_init_thickness:
-            thickness = self.thickness
-            for x in gen_selected_points(layers):
-                x["point"].pressure = thickness
-
-        # 線の濃さを初期化
-        if self.is_init_thickness:
-            strength = self.strength
-            for x in gen_selected_points(layers):
-                x["point"].strength = strength
-
-        curve_node = get_curve("ENTRY_AND_EXIT");
-        mapping = curve_node.mapping
-        if len(mapping.curves) <= 0:
-            return {"FINISHED"}
-        curve = mapping.curves[-1]
-
-        def get_points(is_reverse=False):
-            """ポイントと距離を返す"""
-            points_list = (list(x["stroke"].points) for x in gen_selected_strokes(layers))
-
-            if is_reverse:
-                # 逆順
-                points_list = (x[::-1] for x in points_list)
-
-            for points in points_list:
-                pair_points = zip(points[:1] + points, points)
-
-                s = 0
-                for a, b in pair_points:
-                    s += (a.co - b.co).length
-
-                    if s > length:
-                        break
-
-                    yield b, mapping.evaluate(curve, s / length)
-
-        # 設定対象のポイントを取得
-        gen_points = []
-        if self.is_start:
-            # 始点から
-            gen_points = chain(gen_points, get_points(False))
-
-        if self.is_end:
-            # 終点から
-            gen_points = chain(gen_points, get_points(True))
-
-        # 太さ、濃さを設定
+        is_start = self.is_start
+        is_end = self.is_end
         is_presure = self.is_presure
         is_strength = self.is_strength
-        for point, value in gen_points:
-            if is_presure:
-                point.pressure = point.pressure * value
-            if is_strength:
-                point.strength = point.strength * value
+        is_init_thickness = self.is_init_thickness
+        is_init_strength = self.is_init_strength
+
+        lut = get_curve_lut("ENTRY_AND_EXIT")
+        is_fade = lut is not None and length > 0
+
+        is_changed = False
+        names = ("co", "pressure", "strength", "select")
+        for _, _, arrays in gen_selected_points_arrays(layers, names):
+            offsets = arrays["offsets"]
+            select = arrays["select"]
+            pressure = arrays["pressure"].copy()
+            strength = arrays["strength"].copy()
+
+            # 線の太さを初期化
+            if is_init_thickness:
+                pressure[select] = self.thickness
+
+            # 線の濃さを初期化
+            if is_init_strength:
+                strength[select] = self.strength
+
+            if is_fade:
+                # 始点・終点からの距離を一度に計算
+                distances, lengths = get_stroke_distances(arrays["co"], offsets)
+                end_distances = np.repeat(lengths, np.diff(offsets)) - distances
+
+                # 始点・終点から一定の距離までのポイントの値をカーブで調整する
+                values = np.ones(len(distances))
+                for is_target, d in ((is_start, distances), (is_end, end_distances)):
+                    if not is_target:
+                        continue
+
+                    mask = d <= length
+                    values[mask] *= evaluate_curve_lut(lut, d[mask] / length)
+
+                # 太さ、濃さを設定
+                if is_presure:
+                    pressure *= values
+                if is_strength:
+                    strength *= values
+
+            is_changed = set_points_array(arrays, "pressure", pressure) or is_changed
+            is_changed = set_points_array(arrays, "strength", strength) or is_changed
+
+        if is_changed:
+            invalidate_selection_index()
+            data.update_tag()
 
         return {'FINISHED'}
 
@@ -1389,183 +2438,267 @@ class MRGPEN_OT_fat_stroke(bpy.types.Operator):
             return {'FINISHED'}
 
         # ビューポートの情報を取得
-        spaces = [x for x in context.area.spaces if x.type == "VIEW_3D"]
-        if len(spaces) <= 0:
+        matrix = get_view_matrix(context, obj)
+        if matrix is None:
             return {"FINISHED"}
 
-        view_matrix = spaces[0].region_3d.view_matrix
-        matrix_world = obj.matrix_world
-
-        matrix = view_matrix @ matrix_world
-        matrix_inverted = view_matrix.inverted() @ matrix_world.inverted()
+        matrix_inverted = matrix.inverted()
 
         layers = data.layers
         width = self.width
         position = self.position
 
         # カーブ情報を取得
-        curve_node = get_curve("FAT_STROKE");
-        mapping = curve_node.mapping
-        if len(mapping.curves) <= 0:
+        lut = get_curve_lut("FAT_STROKE")
+        if lut is None:
             return {"FINISHED"}
-        curve = mapping.curves[-1]
 
-        # 選択中のストローク全て処理する
-        for x in gen_selected_strokes(layers):
-            # フレームとストロークの情報を取得
-            frame = x["frame"]
-            stroke = x["stroke"]
+        # オブジェクトのマテリアルの数を取得
+        material_length = len(data.materials) - 1
 
-            def gp():
-                """ポイント, ビューポート上の位置, 始点からの距離のリストを生成"""
-                stroke_points = list(stroke.points)
+        # ブラシ情報を取得
+        brush = bpy.context.tool_settings.gpencil_paint.brush
 
-                sum_length = 0
-                for x, y in zip(stroke_points, (stroke_points[:1] + stroke_points)):
-                    sum_length += (x.co - y.co).length
+        def get_color(key):
+            """設定する色を選択"""
+            if key == "COLOR":
+                return srgb_to_rgb(brush.color) + [1]
+            elif key == "SECONDARY_COLOR":
+                return srgb_to_rgb(brush.secondary_color) + [1]
 
-                    yield {
-                        "point": x,
-                        "viewport_co": matrix @ x.co,
-                        "length": sum_length,
-                    }
+        vertex_color_fill_fill = get_color(self.fill_vertex_color)
+        vertex_color = get_color(self.stroke_vertex_color)
+        vertex_color_fill = get_color(self.stroke_vertex_color_fill)
 
-            points = list(gp())
+        material_index_fill = max(0, min(self.material_index_fill, material_length))
+        material_index = max(0, min(self.material_index, material_length))
 
-            # 最小二乗法でストロークの向きを取得
-            x, y = np.vstack([
-                (co.x, co.y)
-                for co in (
-                    p["viewport_co"]
-                    for p in points
-                )
-            ]).T
-            A = np.vstack([x, np.full_like(x, 1)]).T
-            m, c = np.linalg.lstsq(A, y, rcond=False)[0]
-            a = Vector([1, m + c, 0])
-            a = a.normalized()
-
-            def g(r):
-                """ストロークの位置をずらしたリストを生成する"""
-
-                # 線を増やす方向を決定
-                width_vector = a.copy()
-                quate = Quaternion([0, 0, 1], radians(r))
-                width_vector.rotate(quate)
-
-                # 位置をずらすための絶対位置のベクターも生成
-                width_vector_abs = a.copy()
-                quate_abs = Quaternion([0, 0, 1], radians(abs(r)))
-                width_vector_abs.rotate(quate_abs)
-
-                # ストロークの長さを取得
-                length_points = max(point["length"] for point in points)
-
-                for point in points:
-                    # 幅を取得
-                    w = width * mapping.evaluate(curve, point["length"] / length_points)
-
-                    # 位置を取得
-                    pos = position * mapping.evaluate(curve, point["length"] / length_points)
-
-                    # 線の位置を増やす方向に移動してローカル座標に戻す
-                    co = point["viewport_co"] + width_vector * w + width_vector_abs * pos
-                    co = matrix_inverted @ co
-
-                    yield {
-                        **point,
-                        "co": co,
-                    }
-
-            # 左右のストローク位置を生成
-            from_points1 = list(g(-90))
-            from_points2 = list(g(90))[::-1]
-
-            if self.is_merge_stroke:
-                from_points_list = ((from_points1 + from_points2),)
-            else:
-                from_points_list = (from_points1, from_points2)
+        timings = []
+        t0 = time.perf_counter()
+
+        # 選択中のストロークを全てまとめて読み込む
+        selected_strokes = [
+            (x["frame"], x["stroke"])
+            for x in gen_selected_strokes(layers)
+        ]
+        arrays = get_points_array(
+            (stroke for _, stroke in selected_strokes),
+            ("co", "pressure", "strength", "vertex_color"),
+        )
+        offsets = arrays["offsets"]
+        counts = np.diff(offsets)
+
+        t1 = time.perf_counter()
+        timings.append(("Read", t1 - t0))
+
+        # 始点からの距離の割合でカーブの値を取得
+        distances, lengths = get_stroke_distances(arrays["co"], offsets)
+        stroke_lengths = np.repeat(lengths, counts)
+        t = np.divide(
+            distances,
+            stroke_lengths,
+            out=np.zeros_like(distances),
+            where=stroke_lengths > 0,
+        )
+        values = evaluate_curve_lut(lut, t)
+
+        # ビューポート上でポイントごとの法線の方向にずらす
+        viewport_co = transform_points(matrix, arrays["co"])
+        normals = get_stroke_normals(viewport_co, offsets)
+
+        def g(side):
+            """ストロークの位置をずらしてローカル座標に戻す"""
+            co = viewport_co + normals * (values * (width * side + position))[:, None]
+
+            return transform_points(matrix_inverted, co)
+
+        # 左右のストローク位置を生成(右側はストロークごとに逆順)
+        indices = np.arange(len(t))
+        reverse_indices = (
+            np.repeat(offsets[:-1], counts)
+            + np.repeat(offsets[1:] - 1, counts)
+            - indices
+        )
 
-            # オブジェクトのマテリアルの数を取得
-            material_length = len(data.materials) - 1
+        attrs = {
+            key: arrays[key]
+            for key in ("pressure", "strength", "vertex_color")
+        }
+        if vertex_color:
+            # 色を上書き
+            attrs["vertex_color"] = np.tile(vertex_color, (len(t), 1))
+
+        from_points1 = {"co": g(-1), **attrs}
+        from_points2 = {
+            key: value[reverse_indices]
+            for key, value in {"co": g(1), **attrs}.items()
+        }
+
+        t2 = time.perf_counter()
+        timings.append(("Compute", t2 - t1))
+
+        def get_stroke_points(points_arrays, i):
+            """i番目のストロークのポイントの属性を返す"""
+            start = offsets[i]
+            end = offsets[i + 1]
+
+            return {
+                key: value[start:end]
+                for key, value in points_arrays.items()
+            }
+
+        def concat(*points_arrays_list):
+            """ポイントの属性を連結する"""
+            return {
+                key: np.concatenate([y[key] for y in points_arrays_list])
+                for key in points_arrays_list[0]
+            }
+
+        # ストロークを生成する
+        for i, (frame, stroke) in enumerate(selected_strokes):
+            if counts[i] <= 0:
+                continue
 
-            # ブラシ情報を取得
-            brush = bpy.context.tool_settings.gpencil_paint.brush
+            stroke_points1 = get_stroke_points(from_points1, i)
+            stroke_points2 = get_stroke_points(from_points2, i)
 
             # 位置をもとにFillのみのストロークを生成
             if self.is_fill:
-                is_material = self.is_material_fill
-                material_index = self.material_index_fill
-                material_index = max(0, min(material_index, material_length))
-
-                # 設定する色を選択
-                vertex_color_fill = None
-                if self.fill_vertex_color == "COLOR":
-                    vertex_color_fill = srgb_to_rgb(brush.color) + [1]
-                elif self.fill_vertex_color == "SECONDARY_COLOR":
-                    vertex_color_fill = srgb_to_rgb(brush.secondary_color) + [1]
-
-                for from_points in (from_points1 + from_points2,):
-                    # ストロークを生成
-                    s = frame.strokes.new()
+                from_points = concat(stroke_points1, stroke_points2)
+
+                s = add_stroke(frame, {"co": from_points["co"]})
+                s.vertex_color_fill = vertex_color_fill_fill or stroke.vertex_color_fill
+
+                if self.is_material_fill:
+                    s.material_index = material_index_fill
+                else:
+                    s.material_index = stroke.material_index
+
+            # 位置をもとにストロークを生成
+            if self.is_stroke:
+                if self.is_merge_stroke:
+                    from_points_list = (concat(stroke_points1, stroke_points2),)
+                else:
+                    from_points_list = (stroke_points1, stroke_points2)
+
+                for from_points in from_points_list:
+                    # ストロークを生成し、濃さ、太さ、色をコピー
+                    s = add_stroke(frame, from_points)
+                    s.line_width = stroke.line_width
                     s.vertex_color_fill = vertex_color_fill or stroke.vertex_color_fill
 
-                    if is_material:
-                        s.material_index = material_index
-                    else:
-                        s.material_index = stroke.material_index
+                    if self.is_material:
+                        s.material_index = material_index
+                    else:
+                        s.material_index = stroke.material_index
+
+        t3 = time.perf_counter()
+        timings.append(("Create", t3 - t2))
+
+        if not self.is_keep_stroke:
+            # 元のストロークを消す
+            for i, (frame, stroke) in enumerate(selected_strokes):
+                if counts[i] > 0:
+                    frame.strokes.remove(stroke)
+
+        t4 = time.perf_counter()
+        timings.append(("Remove", t4 - t3))
+
+        invalidate_selection_index()
+        data.update_tag()
+
+        # 処理ごとの時間を表示
+        self.report({"INFO"}, "{}: {} strokes, {}".format(
+            pgt(self.bl_label),
+            len(selected_strokes),
+            ", ".join("{} {:.3f}s".format(name, value) for name, value in timings),
+        ))
+
+        return {'FINISHED'}
+
+
+def get_unique_names(names, used_names):
+    """Blenderと同じ規則(.001, .002...)で重複しない名前のリストを返す
+
+    used_namesに使用済みの名前を追加する
+    """
+    re_match = re.compile(r"^(.*)\.(\d+)$").match
+
+    # 名前ごとに次に試す番号
+    next_numbers = {}
+
+    unique_names = []
+    for name in names:
+        if name in used_names:
+            base, number = name, 0
+            m = re_match(name)
+            if m:
+                base, number = m.group(1), int(m.group(2))
+
+            key = (base, number)
+            number = next_numbers.get(key, number)
+            while True:
+                number += 1
+                name = "{}.{:03d}".format(base, number)
+                if name not in used_names:
+                    break
+
+            next_numbers[key] = number
+
+        used_names.add(name)
+        unique_names.append(name)
+
+    return unique_names
+
 
-                    # ポイントを生成
-                    s.points.add(len(from_points))
-                    for to_point, from_point in zip(s.points, from_points):
-                        to_point.co = from_point["co"]
+def get_new_layer_names(names, type, new_name, find, is_remove_digits):
+    """変更後のレイヤーの名前のリストを返す(重複は考慮しない)
 
-            # 位置をもとにストロークを生成
-            if self.is_stroke:
-                is_material = self.is_material
-                material_index = self.material_index
-                material_index = max(0, min(material_index, material_length))
-
-                # 設定する色を選択
-                vertex_color = None
-                if self.stroke_vertex_color == "COLOR":
-                    vertex_color = srgb_to_rgb(brush.color) + [1]
-                elif self.stroke_vertex_color == "SECONDARY_COLOR":
-                    vertex_color = srgb_to_rgb(brush.secondary_color) + [1]
-
-                vertex_color_fill = None
-                if self.stroke_vertex_color_fill == "COLOR":
-                    vertex_color_fill = srgb_to_rgb(brush.color) + [1]
-                elif self.stroke_vertex_color_fill == "SECONDARY_COLOR":
-                    vertex_color_fill = srgb_to_rgb(brush.secondary_color) + [1]
+    REPLACEの検索の正規表現が不正ならNoneを返す
+    """
+    if is_remove_digits:
+        # 末尾の番号を削除
+        re_sub_digits = re.compile(r"\.\d+$").sub
+        names = [re_sub_digits("", x) for x in names]
+
+    if type == "NEW":
+        return [new_name for _ in names]
+    elif type == "PREFIX":
+        return [new_name + x for x in names]
+    elif type == "SUFFIX":
+        return [x + new_name for x in names]
+    elif type == "REPLACE":
+        try:
+            # ".*"が末尾の空文字にも一致しないように最初の1つだけ置き換える
+            re_sub = re.compile(find).sub
+            return [re_sub(new_name, x, count=1) for x in names]
+        except:
+            return None
 
-                for from_points in from_points_list:
-                    # ストロークを生成
-                    s = frame.strokes.new()
-                    s.line_width = stroke.line_width
-                    s.vertex_color_fill = stroke.vertex_color_fill
+    return list(names)
 
-                    if is_material:
-                        s.material_index = material_index
-                    else:
-                        s.material_index = stroke.material_index
+def rename_layers(renames, layers):
+    """レイヤーの名前を一括で変更する
 
-                    # ポイントを生成
-                    s.points.add(len(from_points))
-                    for to_point, from_point in zip(s.points, from_points):
-                        to_point.co = from_point["co"]
-                        p = from_point["point"]
+    変更後の名前が変更前の他のレイヤーの名前と重なる場合は、先に一時的な名前に変更する
+    """
+    renames = [(l, name) for l, name in renames if l.info != name]
+    new_names = {name for _, name in renames}
 
-                        # 濃さ、太さ、色をコピー
-                        to_point.pressure = p.pressure
-                        to_point.strength = p.strength
-                        to_point.vertex_color = vertex_color or p.vertex_color
+    # 一時的な名前に変更
+    used_names = set(get_layer_names(layers)) | new_names
+    temp_names = iter(get_unique_names(
+        ("mrgpen_rename" for _ in renames),
+        used_names,
+    ))
+    for l, _ in renames:
+        if l.info in new_names:
+            l.info = next(temp_names)
 
-            if not self.is_keep_stroke:
-                # 元のストロークを消す
-                frame.strokes.remove(stroke)
+    for l, name in renames:
+        l.info = name
 
-        return {'FINISHED'}
+    return len(renames)
 
 
 class MRGPEN_OT_rename_layers(bpy.types.Operator):
@@ -1596,6 +2729,35 @@ class MRGPEN_OT_rename_layers(bpy.types.Operator):
     new_name: StringProperty(name="New Name", default="new_name")
     find: StringProperty(name="Find", default=".*")
     is_remove_digits: BoolProperty(name="Digits", default=True)
+    is_preview: BoolProperty(name="Preview", default=False)
+
+    def get_renames(self, layers):
+        """対象のレイヤーと重複しない変更後の名前のリストを返す"""
+        target_layers = None
+        target = self.target
+        if target == "UNLOCKED":
+            target_layers = [l for l in layers if not l.lock]
+        elif target == "VISIBLE":
+            target_layers = [l for l in layers if not l.hide]
+        elif target == "STROKE":
+            target_layers = list(gen_selected_layers(layers))
+
+        new_names = get_new_layer_names(
+            [x.info for x in target_layers],
+            self.type,
+            self.new_name,
+            self.find,
+            self.is_remove_digits,
+        )
+        if new_names is None:
+            return []
+
+        # 対象外のレイヤーの名前と重複しない名前にする
+        target_layer_names = {x.info for x in target_layers}
+        used_names = {x for x in get_layer_names(layers) if x not in target_layer_names}
+        unique_names = get_unique_names(new_names, used_names)
+
+        return list(zip(target_layers, unique_names))
 
     def execute(self, context):
         obj = context.active_object
@@ -1606,48 +2768,45 @@ class MRGPEN_OT_rename_layers(bpy.types.Operator):
             return {'FINISHED'}
 
         # 選択中のストロークがなければ何もしない
-        for _ in gen_selected_strokes(data.layers):
-            break
-        else:
+        if not get_selection_index(data.layers)["entries"]:
+            return {'FINISHED'}
+
+        if self.is_preview:
+            # 変更後の名前の表示のみ
             return {'FINISHED'}
 
-        target_layers = None
         layers = data.layers
-        target = self.target
-        if target == "UNLOCKED":
-            target_layers = (l for l in layers if not l.lock)
-        elif target == "VISIBLE":
-            target_layers = (l for l in layers if not l.hide)
-        elif target == "STROKE":
-            target_layers = gen_selected_layers(layers)
+        rename_layers(self.get_renames(layers), layers)
+        invalidate_selection_index()
 
-        target_layers_pair = None
-        if self.is_remove_digits:
-            re_sub = re.compile(r"\.\d+$").sub
-            target_layers_pair = ((x, re_sub("", x.info)) for x in target_layers)
-        else:
-            target_layers_pair = ((x, x.info) for x in target_layers)
+        return {'FINISHED'}
 
-        t = self.type
-        new_name = self.new_name
-        if t == "NEW":
-            target_layers_pair = ((x, new_name) for x, name in target_layers_pair)
-        elif t == "PREFIX":
-            target_layers_pair = ((x, new_name + name) for x, name in target_layers_pair)
-        elif t == "SUFFIX":
-            target_layers_pair = ((x, name + new_name) for x, name in target_layers_pair)
-        elif t == "REPLACE":
-            try:
-                re_sub = re.compile(self.find).sub
-            except:
-                return {"FINISHED"}
-
-            target_layers_pair = ((x, re_sub(new_name, name)) for x, name in target_layers)
-
-        for l, name in target_layers_pair:
-            l.info = name
+    def draw(self, context):
+        layout = self.layout
 
-        return {'FINISHED'}
+        for x in ("target", "type", "new_name", "find", "is_remove_digits", "is_preview"):
+            layout.prop(self, x)
+
+        if not self.is_preview:
+            return
+
+        # 変更前と変更後の名前を表示
+        box = layout.box()
+        for l, name in self.get_renames(context.active_object.data.layers):
+            r = box.row()
+            r.label(text=l.info)
+            r.label(text=name, icon="FORWARD")
+
+
+# ポイントと一緒に回転させる属性
+rotate_point_attrs = (
+    "co",
+    "pressure",
+    "strength",
+    "vertex_color",
+    "uv_factor",
+    "uv_rotation",
+)
 
 
 class MRGPEN_OT_rotate_points(bpy.types.Operator):
@@ -1682,27 +2841,32 @@ class MRGPEN_OT_rotate_points(bpy.types.Operator):
         is_reverse = self.is_reverse
 
         # 選択中のストロークがなければ何もしない
-        for s in gen_selected_strokes(data.layers):
-            stroke = s['stroke']
-            points = stroke.points
-
-            # 回転する回数
-            c = count % len(points)
+        is_changed = False
+        for _, _, arrays in gen_selected_points_arrays(data.layers, rotate_point_attrs):
+            offsets = arrays["offsets"]
+            counts = np.diff(offsets)
+            if len(counts) <= 0:
+                continue
 
-            # 各ポイントの位置を取得
-            co_list = [x.co.copy() for x in points]
+            # ストロークごとの回転する回数
+            c = count % np.maximum(counts, 1)
 
+            # ポイントごとの置き換え元の番号
+            starts = np.repeat(offsets[:-1], counts)
+            indices = np.arange(int(offsets[-1])) - starts
+            indices = (indices + np.repeat(c, counts)) % np.repeat(counts, counts)
             if is_reverse:
                 # 逆順にする
-                co_list = co_list[::-1]
+                indices = np.repeat(counts, counts) - 1 - indices
+            indices += starts
 
-            # ポイントと置き換え後の位置のジェネレータを生成
-            co_list = co_list[c:] + co_list[:c]
-            target_points_co = zip(points, co_list)
+            # 全ての属性をまとめて置き換える
+            for name in rotate_point_attrs:
+                is_changed = set_points_array(arrays, name, arrays[name][indices]) or is_changed
 
-            for point, co in target_points_co:
-                # 位置を置き換える
-                point.co = co
+        if is_changed:
+            invalidate_selection_index()
+            data.update_tag()
 
         if self.is_switch:
             # 向きだけ変える
@@ -1711,6 +2875,72 @@ class MRGPEN_OT_rotate_points(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def get_moved_layer_order(layer_count, targets, count):
+    """レイヤーを1つずつcount回移動した後の並び順を返す
+
+    並び順はレイヤー番号のリストで、端に着いたレイヤーはそれ以上移動しない
+    """
+    order = list(range(layer_count))
+    positions = list(range(layer_count))
+
+    step = 1 if count > 0 else -1
+    if count > 0:
+        # 上に移動する場合は上のレイヤーから移動する
+        targets = sorted(targets, reverse=True)
+    else:
+        targets = sorted(targets)
+
+    for _ in range(abs(count)):
+        for x in targets:
+            i = positions[x]
+            j = i + step
+            if not (0 <= j < layer_count):
+                continue
+
+            other = order[j]
+            order[i], order[j] = other, x
+            positions[x], positions[other] = j, i
+
+    return order
+
+def get_sorted_layer_order(layer_count, targets, key, is_reverse=False):
+    """対象のレイヤーを、対象のレイヤーがある位置の中で並べ替えた並び順を返す
+
+    リストの上から順にkeyが昇順になるように並べる
+    """
+    order = list(range(layer_count))
+    slots = sorted(targets)
+    sorted_targets = sorted(targets, key=key, reverse=not is_reverse)
+
+    for i, x in zip(slots, sorted_targets):
+        order[i] = x
+
+    return order
+
+def apply_layer_order(layers, order):
+    """最小の移動回数でレイヤーを並び順のとおりに並べ替える
+
+    下から順に、その位置に来るレイヤーを下に移動させる(移動回数は転倒数と同じ)
+    """
+    layer_list = list(layers)
+    current = list(range(len(layer_list)))
+    positions = list(range(len(layer_list)))
+
+    move_count = 0
+    for i, x in enumerate(order):
+        j = positions[x]
+        while j > i:
+            layers.move(layer_list[x], "DOWN")
+
+            other = current[j - 1]
+            current[j - 1], current[j] = x, other
+            positions[x], positions[other] = j - 1, j
+            j -= 1
+            move_count += 1
+
+    return move_count
+
+
 class MRGPEN_OT_move_stroke_layers(bpy.types.Operator):
     """選択したストロークのレイヤーの位置を変える"""
     bl_idname = "mrgpen.move_stroke_layers"
@@ -1725,6 +2955,24 @@ class MRGPEN_OT_move_stroke_layers(bpy.types.Operator):
         name="From Active",
         default=False,
     )
+    sort_key: EnumProperty(
+        name="Sort",
+        default="NONE",
+        items=[
+            ("NONE", "None", ""),
+            ("NAME", "Name", ""),
+            ("PASS_INDEX", "Pass Index", ""),
+            ("POINT_COUNT", "Point Count", ""),
+        ],
+    )
+    is_sort_all: BoolProperty(
+        name="Sort All Layers",
+        default=False,
+    )
+    is_sort_reverse: BoolProperty(
+        name="Sort Reverse",
+        default=False,
+    )
 
     def execute(self, context):
         obj = context.active_object
@@ -1736,25 +2984,45 @@ class MRGPEN_OT_move_stroke_layers(bpy.types.Operator):
 
         count = self.count
         layers = data.layers
-        selected_layers = list(gen_selected_layers(layers))
+        layer_count = len(layers)
+        selected_indices = [x["index"] for x in get_selection_index(layers)["entries"]]
+
+        sort_key = self.sort_key
+        if sort_key != "NONE":
+            # 並べ替え
+            targets = list(range(layer_count)) if self.is_sort_all else selected_indices
+            layer_list = list(layers)
+
+            key = None
+            if sort_key == "NAME":
+                key = lambda x: layer_list[x].info
+            elif sort_key == "PASS_INDEX":
+                key = lambda x: layer_list[x].pass_index
+            elif sort_key == "POINT_COUNT":
+                point_counts = [
+                    sum(len(s.points) for f in l.frames for s in f.strokes)
+                    for l in layer_list
+                ]
+                key = lambda x: point_counts[x]
+
+            order = get_sorted_layer_order(layer_count, targets, key, self.is_sort_reverse)
+        else:
+            if not selected_indices:
+                return {'FINISHED'}
 
-        if self.from_active:
-            active_index = layers.active_index
-            selected_layers_index_min = min(layers.find(x.info) for x in selected_layers)
+            if self.from_active:
+                active_index = layers.active_index
+                selected_layers_index_min = min(selected_indices)
 
-            count = count + active_index - selected_layers_index_min
-            if active_index < selected_layers_index_min:
-                count += 1
+                count = count + active_index - selected_layers_index_min
+                if active_index < selected_layers_index_min:
+                    count += 1
 
-        if count > 0:
-            selected_layers = selected_layers[::-1]
-            direction = "UP"
-        elif count < 0:
-            direction = "DOWN"
+            order = get_moved_layer_order(layer_count, selected_indices, count)
 
-        for _ in range(abs(count)):
-            for l in selected_layers:
-                layers.move(l, direction)
+        # 移動後の並び順まで最小の回数で移動する
+        if apply_layer_order(layers, order) > 0:
+            invalidate_selection_index()
 
         return {'FINISHED'}
 
@@ -1808,8 +3076,39 @@ class MRGPEN_OT_remove_layer_filter(bpy.types.Operator):
         return {'FINISHED'}
 
 
+# 区間の長さの分布で表示するパーセンタイル
+sample_length_percentiles = (0, 10, 25, 50, 75, 90, 100)
+
+# 区間の長さのヒストグラムの階級の数
+sample_length_bin_count = 10
+
+def get_segment_lengths(layers):
+    """選択中のストロークの隣り合うポイントの距離を全て返す(0は除く)"""
+    lengths_list = []
+    for _, _, arrays in gen_selected_points_arrays(layers, ("co",)):
+        co = arrays["co"]
+        if len(co) < 2:
+            continue
+
+        lengths = np.linalg.norm(np.diff(co.astype(np.float64), axis=0), axis=1)
+
+        # ストロークをまたぐ区間は除く
+        mask = np.ones(len(lengths), dtype=bool)
+        ends = arrays["offsets"][1:-1] - 1
+        mask[ends[(ends >= 0) & (ends < len(lengths))]] = False
+
+        lengths_list.append(lengths[mask])
+
+    if not lengths_list:
+        return np.zeros(0)
+
+    lengths = np.concatenate(lengths_list)
+
+    return lengths[lengths > 0]
+
+
 class MRGPEN_OT_pick_sample_length(bpy.types.Operator):
-    """選択中のストロークからsample値を取得する"""
+    """選択中の全てのストロークからsample値を取得する"""
     bl_idname = "mrgpen.pick_sample_length"
     bl_label = "Pick Sample Length"
     bl_options = {"REGISTER", "UNDO"}
@@ -1819,6 +3118,7 @@ class MRGPEN_OT_pick_sample_length(bpy.types.Operator):
         default="average",
         items=[
             ("average", "Average", ""),
+            ("median", "Median", ""),
             ("min", "Min", ""),
             ("max", "Max", ""),
         ],
@@ -1833,21 +3133,268 @@ class MRGPEN_OT_pick_sample_length(bpy.types.Operator):
             return {'FINISHED'}
 
         layers = data.layers
+        wm = context.window_manager.mrgpen
 
-        # 取得に使用するメソッド
-        method = getattr(np, self.method)
+        # 選択中の全てのストロークの区間の長さ
+        lengths = get_segment_lengths(layers)
 
-        # 選択中ストロークの最初の一つから長さを計算する
-        for x in gen_selected_strokes(layers):
-            # 全点取得
-            p = [y.co for y in x["stroke"].points]
+        wm.sample_length_count = len(lengths)
+        if len(lengths) <= 0:
+            return {'FINISHED'}
 
-            # 各点の距離を取得して、メソッドで計算
-            a = method([y for y in ((a - b).length for a, b in zip(p, p[1:])) if y > 0])
+        # 取得に使用するメソッドで計算し、メニューの長さに設定する
+        wm.sample_length = float(getattr(np, self.method)(lengths))
 
-            # メニューの長さに設定する
-            context.window_manager.mrgpen.sample_length = a
-            break
+        # 分布をパネルに表示するために保存する
+        percentiles = np.percentile(lengths, sample_length_percentiles)
+        histogram, _ = np.histogram(
+            lengths,
+            bins=sample_length_bin_count,
+            range=(percentiles[0], percentiles[-1]),
+        )
+        wm.sample_length_percentiles = percentiles.tolist()
+        wm.sample_length_histogram = histogram.tolist()
+
+        return {'FINISHED'}
+
+
+class MRGPEN_OT_resample_strokes(bpy.types.Operator):
+    """選択中のストロークを弧長で等間隔にリサンプルする"""
+    bl_idname = "mrgpen.resample_strokes"
+    bl_label = "Resample Strokes"
+    bl_options = {"REGISTER", "UNDO"}
+
+    type: EnumProperty(
+        name="Type",
+        default="SPACING",
+        items=[
+            ("SPACING", "Spacing", ""),
+            ("COUNT", "Count", ""),
+            ("ERROR", "Error", ""),
+        ],
+    )
+    length: FloatProperty(name="Length", default=.01, min=0)
+    count: IntProperty(name="Count", default=10, min=2)
+    error: FloatProperty(name="Error", default=.001, min=0)
+
+    def execute(self, context):
+        obj = context.active_object
+        data = obj.data
+
+        # Grease Pencil
+        if not obj and obj.type == "GPENCIL":
+            return {'FINISHED'}
+
+        layers = data.layers
+        t = self.type
+        length = self.length
+
+        if t == "SPACING" and length <= 0:
+            return {'FINISHED'}
+
+        stroke_count = 0
+        skipped_count = 0
+        old_point_count = 0
+        new_point_count = 0
+
+        # フレームごとにリサンプルした属性と、減らすポイントのマスクを作る
+        targets = []
+        for _, _, arrays in gen_selected_points_arrays(layers, resample_point_attrs + ("select",)):
+            offsets = arrays["offsets"]
+            old_counts = np.diff(offsets)
+            _, lengths = get_stroke_distances(arrays["co"], offsets)
+
+            # 長さのないストロークはリサンプルしない
+            is_target = (old_counts >= 2) & (lengths > 0)
+
+            counts = None
+            if t == "SPACING":
+                counts = np.ceil(lengths / length).astype(np.int64) + 1
+            elif t == "COUNT":
+                counts = np.full(len(lengths), self.count, dtype=np.int64)
+            elif t == "ERROR":
+                # 元のポイントの数の2倍までで誤差が収まる数にする
+                counts = get_resample_counts_by_error(
+                    arrays,
+                    self.error,
+                    np.where(is_target, np.maximum(old_counts * 2, 2), 0),
+                )
+
+                # 誤差が収まらないストロークはそのままにする
+                is_skipped = is_target & (counts < 2)
+                skipped_count += int(np.count_nonzero(is_skipped))
+                is_target &= ~is_skipped
+
+            counts = np.where(is_target, np.maximum(counts, 2), 0)
+
+            # ポイントが減るストロークは先頭からcounts個を残す
+            limits = np.where(is_target, np.minimum(counts, old_counts), old_counts)
+            keep = np.arange(int(offsets[-1])) - np.repeat(offsets[:-1], old_counts) < np.repeat(limits, old_counts)
+
+            targets.append((arrays, keep, is_target, counts, resample_points_array(arrays, counts)))
+
+            stroke_count += int(np.count_nonzero(is_target))
+            old_point_count += int(old_counts[is_target].sum())
+            new_point_count += int(counts[is_target].sum())
+
+        # ポイントが減るストロークは全てのフレームをまとめて縮める
+        remove_points(context, [(arrays, keep) for arrays, keep, _, _, _ in targets])
+
+        # ポイントが増えるストロークは1回で追加する
+        for arrays, _, is_target, counts, _ in targets:
+            strokes = arrays["strokes"]
+            for i in np.flatnonzero(is_target):
+                points = strokes[i].points
+                diff = int(counts[i]) - len(points)
+                if diff > 0:
+                    points.add(diff)
+
+        # リサンプルした属性を書き込む
+        for arrays, _, is_target, counts, resampled in targets:
+            strokes = arrays["strokes"]
+            new_offsets = resampled["offsets"]
+            for i in np.flatnonzero(is_target):
+                points = strokes[i].points
+                start = new_offsets[i]
+                end = new_offsets[i + 1]
+                for name in resample_point_attrs:
+                    values = np.ascontiguousarray(resampled[name][start:end], dtype=point_attrs[name][1])
+                    points.foreach_set(name, values.reshape(-1))
+                points.foreach_set("select", np.ones(int(counts[i]), dtype=bool))
+
+        invalidate_selection_index()
+        data.update_tag()
+
+        self.report({"INFO"}, "{}: {} strokes, {} -> {} points, {} skipped".format(
+            pgt(self.bl_label),
+            stroke_count,
+            old_point_count,
+            new_point_count,
+            skipped_count,
+        ))
+
+        return {'FINISHED'}
+
+
+class MRGPEN_OT_simplify_strokes(bpy.types.Operator):
+    """選択中のストロークの形状を保ったままポイントを減らす"""
+    bl_idname = "mrgpen.simplify_strokes"
+    bl_label = "Simplify Strokes"
+    bl_options = {"REGISTER", "UNDO"}
+
+    error: FloatProperty(name="Error", default=.002, min=0)
+
+    def execute(self, context):
+        obj = context.active_object
+        data = obj.data
+
+        # Grease Pencil
+        if not obj and obj.type == "GPENCIL":
+            return {'FINISHED'}
+
+        # ビューポートの情報を取得
+        matrix = get_view_matrix(context, obj)
+        if matrix is None:
+            return {"FINISHED"}
+
+        layers = data.layers
+        names = tuple(point_attrs)
+
+        # ビューポート上の位置で残すポイントを決める
+        frames = []
+        for _, _, arrays in gen_selected_points_arrays(layers, names):
+            co = transform_points(matrix, arrays["co"].astype(np.float64))
+            frames.append((arrays, get_simplify_mask(co, arrays["offsets"], self.error)))
+
+        # 全てのフレームのポイントをまとめて削除する
+        stroke_count = 0
+        removed_count = 0
+        for removed_counts in remove_points(context, frames):
+            stroke_count += int(np.count_nonzero(removed_counts))
+            removed_count += int(removed_counts.sum())
+
+        invalidate_selection_index()
+        data.update_tag()
+
+        self.report({"INFO"}, "{}: {} strokes, {} points removed".format(
+            pgt(self.bl_label),
+            stroke_count,
+            removed_count,
+        ))
+
+        return {'FINISHED'}
+
+
+class MRGPEN_OT_clean_up_strokes(bpy.types.Operator):
+    """選択中のストロークの重複したポイントと、長さのないストロークを削除する"""
+    bl_idname = "mrgpen.clean_up_strokes"
+    bl_label = "Clean Up Strokes"
+    bl_options = {"REGISTER", "UNDO"}
+
+    distance: FloatProperty(name="Distance", default=0, min=0)
+    is_remove_points: BoolProperty(name="Duplicate Points", default=True)
+    is_remove_strokes: BoolProperty(name="Zero Length Strokes", default=True)
+
+    def execute(self, context):
+        obj = context.active_object
+        data = obj.data
+
+        # Grease Pencil
+        if not obj and obj.type == "GPENCIL":
+            return {'FINISHED'}
+
+        layers = data.layers
+        names = tuple(point_attrs)
+
+        # 削除するポイントとストロークを決める
+        targets = []
+        for layer, frame, arrays in gen_selected_points_arrays(layers, names):
+            offsets = arrays["offsets"]
+            counts = np.diff(offsets)
+
+            duplicate = get_duplicate_points_mask(arrays["co"], offsets, self.distance)
+
+            # 長さがdistance以下のストロークは長さがない
+            _, lengths = get_stroke_distances(arrays["co"], offsets)
+            is_remove_stroke = lengths <= self.distance
+            if not self.is_remove_strokes:
+                is_remove_stroke[:] = False
+
+            # 削除するストロークのポイントは書き込まない
+            keep = ~duplicate if self.is_remove_points else np.ones(len(duplicate), dtype=bool)
+            keep |= np.repeat(is_remove_stroke, counts)
+
+            targets.append((layer, frame, arrays, keep, is_remove_stroke))
+
+        # 全てのフレームのポイントをまとめて削除してから、ストロークを削除する
+        removed_counts_list = remove_points(context, [(x[2], x[3]) for x in targets])
+
+        # レイヤーごとの削除したポイントとストロークの数
+        removed = {}
+        for (layer, frame, arrays, _, is_remove_stroke), removed_counts in zip(targets, removed_counts_list):
+            point_count = int(removed_counts.sum())
+
+            strokes = frame.strokes
+            for x in compress(arrays["strokes"], is_remove_stroke):
+                strokes.remove(x)
+
+            stroke_count = int(np.count_nonzero(is_remove_stroke))
+            if point_count or stroke_count:
+                removed[layer.info] = (point_count, stroke_count)
+
+        invalidate_selection_index()
+        data.update_tag()
+
+        # レイヤーごとに削除した数を表示
+        self.report({"INFO"}, "{}: {} points, {} strokes ({})".format(
+            pgt(self.bl_label),
+            sum(x for x, _ in removed.values()),
+            sum(x for _, x in removed.values()),
+            ", ".join(
+                "{}: {} points, {} strokes".format(name, point_count, stroke_count)
+                for name, (point_count, stroke_count) in removed.items()
+            ),
+        ))
 
         return {'FINISHED'}
 
@@ -1864,10 +3411,7 @@ class MRGPEN_MT_add_new_layer_menu(bpy.types.Menu):
         # 特定のモードかどうか
         is_editable = mode in {"EDIT_GPENCIL", "SCULPT_GPENCIL", "VERTEX_GPENCIL"}
 
-        is_selected = False
-        for x in gen_selected_points(layers):
-            is_selected = True
-            break
+        is_selected = has_selected_points(layers)
 
         ano = layout.operator(MRGPEN_OT_add_new_layer.bl_idname,
             text=pgt("Add New Layer"))
@@ -1919,16 +3463,9 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
         data = context.active_object.data
         layers = data.layers
 
-        is_selected = False
-        layer = None
-        stroke = None
-        point = None
-        for x in gen_selected_points(layers):
-            layer = x["layer"];
-            stroke = x["stroke"];
-            point = x["point"];
-            is_selected = True
-            break
+        draw_info = get_draw_info(layers)
+        is_selected = draw_info["is_selected"]
+        layer = layers[draw_info["layer_index"]] if is_selected else None
 
         # 特定のモードかどうか
         is_editable = mode in {"EDIT_GPENCIL", "SCULPT_GPENCIL", "VERTEX_GPENCIL"}
@@ -2044,7 +3581,7 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
             )
             # 選択ストロークのレイヤーを一括で表示・非表示を切り替えるボタン
             def c(method, key, icon_on, icon_off):
-                value = all(getattr(x, key) for x in gen_selected_layers(layers))
+                value = draw_info[key]
                 elm = column2_1.operator(
                     MRGPEN_OT_edit_layer_or_material.bl_idname,
                     icon=icon_on if value else icon_off,
@@ -2056,8 +3593,8 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                 elm.value = not value
                 elm.name = ""
 
-            c("HIDE", "hide", "HIDE_ON", "HIDE_OFF")
-            c("LOCK", "lock", "LOCKED", "UNLOCKED")
+            c("HIDE", "is_hide", "HIDE_ON", "HIDE_OFF")
+            c("LOCK", "is_lock", "LOCKED", "UNLOCKED")
 
             rl = column2_2.operator(MRGPEN_OT_rename_layers.bl_idname,
                 text="R")
@@ -2080,12 +3617,14 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                 snc_sf.type = "SELECT"
                 snc_sf.target = "FILL"
                 snc_sf.threshold = wm.color_threshold
+                snc_sf.color_space = wm.color_space
 
                 snc_df = row.operator(MRGPEN_OT_select_nearest_color.bl_idname,
                     text=pgt("Deselect"))
                 snc_df.type = "DESELECT"
                 snc_df.target = "FILL"
                 snc_df.threshold = wm.color_threshold
+                snc_df.color_space = wm.color_space
 
                 box.label(text=pgt("Nearest Stroke Color Stroke"))
                 row = box.row(align=True)
@@ -2094,14 +3633,17 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                 snc_ss.type = "SELECT"
                 snc_ss.target = "STROKE"
                 snc_ss.threshold = wm.color_threshold
+                snc_ss.color_space = wm.color_space
 
                 snc_ds = row.operator(MRGPEN_OT_select_nearest_color.bl_idname,
                     text=pgt("Deselect"))
                 snc_ds.type = "DESELECT"
                 snc_ds.target = "STROKE"
                 snc_ds.threshold = wm.color_threshold
+                snc_ds.color_space = wm.color_space
 
                 box.prop(wm, "color_threshold", text="Threshold")
+                box.prop(wm, "color_space", text="Color Space")
                 box.separator()
 
         # ストロークのレイヤー関係の機能
@@ -2157,19 +3699,7 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                         emboss=False,
                     )
                     if wm.is_show_all_vertex_color:
-                        r = box.grid_flow(
-                            align=True,
-                            even_columns=True,
-                            even_rows=True,
-                        )
-                        for x in gen_selected_points(layers):
-                            c = r.column(align=True)
-                            c.prop(
-                                x["point"],
-                                "vertex_color",
-                                text="",
-                            )
-                            c.ui_units_x = 1
+                        palette_grid(box, "point")
                     else:
                         box.prop(wm, "vertex_color", text="")
 
@@ -2184,19 +3714,7 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                         emboss=False,
                     )
                     if wm.is_show_all_vertex_color_fill:
-                        r = box.grid_flow(
-                            align=True,
-                            even_columns=True,
-                            even_rows=True,
-                        )
-                        for x in gen_selected_strokes(layers):
-                            c = r.column(align=True)
-                            c.prop(
-                                x["stroke"],
-                                "vertex_color_fill",
-                                text="",
-                            )
-                            c.ui_units_x = 1
+                        palette_grid(box, "stroke")
                     else:
                         box.prop(wm, "vertex_color_fill", text="")
 
@@ -2216,16 +3734,86 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                 bo(MRGPEN_OT_set_random_tint_color_brush.bl_idname,
                     text=pgt("Set Random Tint Brush"))
 
+        def sample_length_distribution(layout):
+            """取得した区間の長さのパーセンタイルとヒストグラムを表示"""
+            c = layout.column(align=True)
+            c.label(text="{} segments".format(wm.sample_length_count))
+            for p, value in zip(sample_length_percentiles, wm.sample_length_percentiles):
+                r = c.row()
+                r.label(text="{}%".format(p))
+                r.label(text="{:.4f}".format(value))
+
+            histogram = tuple(wm.sample_length_histogram)
+            low = wm.sample_length_percentiles[0]
+            step = (wm.sample_length_percentiles[-1] - low) / sample_length_bin_count
+            max_count = max(max(histogram), 1)
+
+            c = layout.column(align=True)
+            for i, count in enumerate(histogram):
+                r = c.row()
+                r.label(text="{:.4f}".format(low + step * i))
+                r.label(text="|" * round(count / max_count * 20))
+                r.label(text=str(count))
+
+        def stats_prop(layout, name, text):
+            """プロパティと、選択中の値がバラバラなら最小値・最大値を表示"""
+            r = layout.row(align=True)
+            r.prop(wm, name, text=text)
+
+            value_stats = get_selection_stats(layers).get(name)
+            if not value_stats or not value_stats["is_mixed"]:
+                return
+
+            if value_stats["min"].ndim > 0:
+                r.label(text=pgt("Mixed"))
+            else:
+                r.label(text="{:.3f} - {:.3f}".format(
+                    float(value_stats["min"]),
+                    float(value_stats["max"]),
+                ))
+
+        def palette_grid(layout, target):
+            """選択中の頂点色を重複をなくしてページごとに表示"""
+            name = palette_attrs[target]
+            palette = get_palette(layers, target)
+            colors = palette["colors"]
+            counts = palette["counts"]
+
+            page = get_palette_page(wm, target, len(colors))
+            page_count = max(1, -(-len(colors) // palette_page_size))
+
+            if page_count > 1:
+                r = layout.row(align=True)
+                r.prop(wm, name + "_page", text="Page")
+                r.label(text="/ {}".format(page_count))
+
+            r = layout.grid_flow(
+                align=True,
+                even_columns=True,
+                even_rows=True,
+            )
+            start = page * palette_page_size
+            for i in range(min(palette_page_size, len(colors) - start)):
+                c = r.column(align=True)
+                c.prop(wm, "{}_palette_{}".format(name, i), text="")
+                c.label(text=str(counts[start + i]))
+                c.ui_units_x = 1
+
         if is_editable and is_selected:
             box = layout.box()
             if submenu(box, "is_collapse_points", "Points"):
-                box.prop(wm, "strength", text="Strength")
-                box.prop(wm, "pressure", text="Pressure")
-                box.prop(wm, "vertex_color", text="Color")
+                stats_prop(box, "strength", "Strength")
+                stats_prop(box, "pressure", "Pressure")
+                stats_prop(box, "vertex_color", "Color")
                 box.operator(MRGPEN_OT_rotate_points.bl_idname,
                     text=pgt("Rotate Points"))
 
-                ss = box.operator("gpencil.stroke_sample")
+                ss = box.operator(MRGPEN_OT_resample_strokes.bl_idname,
+                    text=pgt("Resample Strokes"))
+                box.operator(MRGPEN_OT_simplify_strokes.bl_idname,
+                    text=pgt("Simplify Strokes"))
+                box.operator(MRGPEN_OT_clean_up_strokes.bl_idname,
+                    text=pgt("Clean Up Strokes"))
 
                 r = box.row(align=True)
                 r.prop(wm, "sample_length", text="Sample Length")
@@ -2235,12 +3823,15 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
 
                 ss.length = wm.sample_length
 
+                if wm.sample_length_count > 0 and submenu(box, "is_collapse_sample_length", "Distribution"):
+                    sample_length_distribution(box)
+
         if is_editable and is_selected:
             box = layout.box()
             if submenu(box, "is_collapse_strokes", "Strokes"):
-                box.prop(wm, "line_width", text="Width")
-                box.prop(wm, "hardness", text="Hardness")
-                box.prop(wm, "vertex_color_fill", text="Fill")
+                stats_prop(box, "line_width", "Width")
+                stats_prop(box, "hardness", "Hardness")
+                stats_prop(box, "vertex_color_fill", "Fill")
                 box.prop(wm, "draw_cyclic", text="Cyclic")
 
                 box.prop(wm, "start_cap_mode", text="Start Cap Mode")
@@ -2267,15 +3858,21 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
                 asm.method = "REMOVE"
                 asm.is_init = False
 
+                def curve_mapping(name):
+                    """カーブを表示(なければ描画の外で作成する)"""
+                    curve_node = find_curve(name)
+                    if curve_node:
+                        box.template_curve_mapping(curve_node, 'mapping')
+                    elif not bpy.app.timers.is_registered(ensure_curves):
+                        bpy.app.timers.register(ensure_curves)
+
                 bo(MRGPEN_OT_fade_stroke_edge.bl_idname,
                     text=pgt("Fade Stroke Edge"))
-                curve_entry_and_exit = get_curve("ENTRY_AND_EXIT")
-                box.template_curve_mapping(curve_entry_and_exit, 'mapping')
+                curve_mapping("ENTRY_AND_EXIT")
 
                 bo(MRGPEN_OT_fat_stroke.bl_idname,
                     text=pgt("Fat Stroke"))
-                fat_stroke_curve = get_curve("FAT_STROKE")
-                box.template_curve_mapping(fat_stroke_curve, 'mapping')
+                curve_mapping("FAT_STROKE")
 
         if is_editable and not is_selected:
             layout.label(text=pgt("No Selected Stroke."))
@@ -2285,6 +3882,249 @@ class MRGPEN_PT_view_3d_label(bpy.types.Panel):
         o = context.active_object
         return (o and o.type == "GPENCIL")
 
+# 統計情報を集計するポイントの属性
+stats_point_attrs = ("pressure", "strength", "vertex_color")
+
+# 統計情報を集計するストロークの属性
+stats_stroke_attrs = ("line_width", "hardness", "vertex_color_fill")
+
+def get_values_stats(values):
+    """値の平均・最小・最大と、値がバラバラかどうかを返す"""
+    if len(values) <= 0:
+        return None
+
+    min_value = values.min(axis=0)
+    max_value = values.max(axis=0)
+
+    return {
+        "mean": values.mean(axis=0),
+        "min": min_value,
+        "max": max_value,
+        "is_mixed": bool(np.any(min_value != max_value)),
+    }
+
+def build_selection_stats(layers):
+    """選択中のポイント・ストロークの統計情報を作成する"""
+    values_dict = {name: [] for name in stats_point_attrs + stats_stroke_attrs}
+
+    # 選択中のポイントの値
+    for _, _, arrays in gen_selected_points_arrays(layers, stats_point_attrs + ("select",)):
+        select = arrays["select"]
+        for name in stats_point_attrs:
+            values_dict[name].append(arrays[name][select])
+
+    # 選択中のストロークの値
+    for _, frame, stroke_mask in gen_selected_stroke_masks(layers):
+        strokes = frame.strokes
+        for name in stats_stroke_attrs:
+            values_dict[name].append(get_strokes_array(strokes, name)[stroke_mask])
+
+    stats = {}
+    for name, values in values_dict.items():
+        if not values:
+            continue
+
+        value_stats = get_values_stats(np.concatenate(values))
+        if value_stats:
+            stats[name] = value_stats
+
+    return stats
+
+def get_selection_stats(layers):
+    """キャッシュ済みの選択中の統計情報を返す"""
+    index = get_selection_index(layers)
+
+    if "stats" not in index:
+        index["stats"] = build_selection_stats(layers)
+
+    return index["stats"]
+
+def build_draw_info(layers):
+    """パネルの描画に使う選択中の情報を作成する"""
+    index = get_selection_index(layers)
+
+    layer_index = None
+    for x in index["entries"]:
+        if x["point_count"] > 0:
+            layer_index = x["index"]
+            break
+
+    selected_layers = list(gen_selected_layers(layers))
+
+    return {
+        "is_selected": layer_index is not None,
+        "layer_index": layer_index,
+        "is_hide": all(x.hide for x in selected_layers),
+        "is_lock": all(x.lock for x in selected_layers),
+    }
+
+def get_draw_info(layers):
+    """キャッシュ済みのパネルの描画に使う情報を返す
+
+    選択情報と一緒に破棄されるので、選択やデータが変わらない再描画では再計算しない
+    """
+    index = get_selection_index(layers)
+
+    if "draw" not in index:
+        index["draw"] = build_draw_info(layers)
+
+    return index["draw"]
+
+# 頂点色のパレットの1ページに表示する色の数
+palette_page_size = 16
+
+# パレットに表示する属性
+palette_attrs = {
+    "point": "vertex_color",
+    "stroke": "vertex_color_fill",
+}
+
+def build_palette(layers, target):
+    """選択中の頂点色の重複をなくした色と数を、最初に出てきた順で返す"""
+    if target == "point":
+        colors = [
+            arrays["vertex_color"][arrays["select"]]
+            for _, _, arrays in gen_selected_points_arrays(layers, ("vertex_color", "select"))
+        ]
+    else:
+        colors = [
+            get_strokes_array(frame.strokes, "vertex_color_fill")[stroke_mask]
+            for _, frame, stroke_mask in gen_selected_stroke_masks(layers)
+        ]
+
+    if not colors:
+        return {
+            "colors": np.zeros((0, 4), dtype=np.float32),
+            "counts": np.zeros(0, dtype=np.int64),
+        }
+
+    unique_colors, first_indices, counts = np.unique(
+        np.concatenate(colors),
+        axis=0,
+        return_index=True,
+        return_counts=True,
+    )
+    order = np.argsort(first_indices, kind="stable")
+
+    return {
+        "colors": unique_colors[order],
+        "counts": counts[order],
+    }
+
+def get_palette(layers, target):
+    """キャッシュ済みの選択中の頂点色のパレットを返す"""
+    index = get_selection_index(layers)
+
+    key = "palette_" + target
+    if key not in index:
+        index[key] = build_palette(layers, target)
+
+    return index[key]
+
+def get_palette_page(wm, target, count):
+    """表示中のパレットのページ番号を返す"""
+    page = getattr(wm, palette_attrs[target] + "_page")
+    page_count = max(1, -(-count // palette_page_size))
+
+    return min(page, page_count - 1)
+
+def edit_palette_color(self, target, i, value=None):
+    """パレットの色を取得・設定する
+
+    設定すると、選択中でその色のポイント・ストロークを全て書き換える
+    """
+    obj = bpy.context.active_object
+    data = obj.data
+
+    # Grease Pencil
+    if not obj and obj.type == "GPENCIL":
+        return (0, 0, 0, 0)
+
+    layers = data.layers
+    palette = get_palette(layers, target)
+    colors = palette["colors"]
+
+    index = get_palette_page(self, target, len(colors)) * palette_page_size + i
+    if index >= len(colors):
+        return (0, 0, 0, 0)
+
+    old_color = colors[index].copy()
+    if value is None:
+        # get
+        return tuple(old_color.tolist())
+
+    # set
+    value = np.asarray(value, dtype=np.float32)
+    if np.array_equal(old_color, value):
+        return
+
+    is_changed = False
+    if target == "point":
+        for _, _, arrays in gen_selected_points_arrays(layers, ("vertex_color", "select")):
+            values = arrays["vertex_color"].copy()
+            values[arrays["select"] & (values == old_color).all(axis=1)] = value
+
+            is_changed = set_points_array(arrays, "vertex_color", values) or is_changed
+    else:
+        for _, frame, stroke_mask in gen_selected_stroke_masks(layers):
+            strokes = frame.strokes
+            values = get_strokes_array(strokes, "vertex_color_fill")
+
+            mask = stroke_mask & (values == old_color).all(axis=1)
+            if not mask.any():
+                continue
+
+            values[mask] = value
+            set_strokes_array(strokes, "vertex_color_fill", values)
+            is_changed = True
+
+    if is_changed:
+        invalidate_selection_index()
+        data.update_tag()
+
+def set_selected_points_attr(layers, name, value):
+    """選択中の全てのポイントの属性をまとめて書き込む"""
+    if name not in point_attrs:
+        for x in gen_selected_points(layers):
+            setattr(x["point"], name, value)
+        return True
+
+    value = np.asarray(value, dtype=point_attrs[name][1])
+
+    is_changed = False
+    for _, _, arrays in gen_selected_points_arrays(layers, (name, "select")):
+        values = arrays[name].copy()
+        values[arrays["select"]] = value
+
+        is_changed = set_points_array(arrays, name, values) or is_changed
+
+    return is_changed
+
+def set_selected_strokes_attr(layers, name, value):
+    """選択中の全てのストロークの属性をまとめて書き込む"""
+    if name not in stroke_attrs:
+        for x in gen_selected_strokes(layers):
+            setattr(x["stroke"], name, value)
+        return True
+
+    value = np.asarray(value, dtype=stroke_attrs[name][1])
+
+    is_changed = False
+    for _, frame, stroke_mask in gen_selected_stroke_masks(layers):
+        strokes = frame.strokes
+        old_values = get_strokes_array(strokes, name)
+
+        values = old_values.copy()
+        values[stroke_mask] = value
+        if np.array_equal(old_values, values):
+            # 値が変わらなければ書き込まない
+            continue
+
+        set_strokes_array(strokes, name, values)
+        is_changed = True
+
+    return is_changed
+
 def edit_strokes_attr(self, target, name, value=None, default_value=None):
     """選択中の全てのストロークのプロパティを取得・設定する"""
     obj = bpy.context.active_object
@@ -2296,18 +4136,38 @@ def edit_strokes_attr(self, target, name, value=None, default_value=None):
 
     layers = data.layers
 
-    strokes = []
-    if target == "stroke":
-        strokes = gen_selected_strokes(layers)
-    elif target == "point":
-        strokes = gen_selected_points(layers)
-
     if value is not None:
         # set
-        for x in strokes:
-            setattr(x[target], name, value)
+        is_changed = False
+        if target == "stroke":
+            is_changed = set_selected_strokes_attr(layers, name, value)
+        elif target == "point":
+            is_changed = set_selected_points_attr(layers, name, value)
+
+        if is_changed:
+            invalidate_selection_index()
+            data.update_tag()
+
     elif default_value is not None:
         # get
+        if name in stats_point_attrs + stats_stroke_attrs:
+            # 選択中の値の平均
+            value_stats = get_selection_stats(layers).get(name)
+            if not value_stats:
+                return default_value
+
+            mean = value_stats["mean"]
+            if mean.ndim > 0:
+                return tuple(mean.tolist())
+
+            return float(mean)
+
+        strokes = []
+        if target == "stroke":
+            strokes = gen_selected_strokes(layers)
+        elif target == "point":
+            strokes = gen_selected_points(layers)
+
         for x in strokes:
             return getattr(x[target], name)
         else:
@@ -2336,10 +4196,16 @@ class MRGPEN_WindowManager(PropertyGroup):
     is_collapse_vertex_color: BoolProperty(default=True)
     is_show_all_vertex_color: BoolProperty(default=False)
     is_show_all_vertex_color_fill: BoolProperty(default=False)
+    vertex_color_page: IntProperty(default=0, min=0)
+    vertex_color_fill_page: IntProperty(default=0, min=0)
     is_collapse_other: BoolProperty(default=True)
     is_collapse_strokes: BoolProperty(default=True)
     is_collapse_points: BoolProperty(default=True)
     color_threshold: FloatProperty(default=.01)
+    color_space: EnumProperty(
+        default="RGB",
+        items=color_space_list,
+    )
     vertex_color: FloatVectorProperty(
         size=4,
         subtype="COLOR",
@@ -2413,6 +4279,23 @@ class MRGPEN_WindowManager(PropertyGroup):
         default=.01,
         min=0,
     )
+    is_collapse_sample_length: BoolProperty(default=False)
+    sample_length_count: IntProperty(default=0, min=0)
+    sample_length_percentiles: FloatVectorProperty(size=len(sample_length_percentiles))
+    sample_length_histogram: IntVectorProperty(size=sample_length_bin_count)
+
+
+# パレットの色のプロパティを追加
+for i in range(palette_page_size):
+    for target, name in palette_attrs.items():
+        MRGPEN_WindowManager.__annotations__["{}_palette_{}".format(name, i)] = FloatVectorProperty(
+            size=4,
+            subtype="COLOR",
+            min=0,
+            max=1,
+            get=lambda self, target=target, i=i: edit_palette_color(self, target, i),
+            set=lambda self, v, target=target, i=i: edit_palette_color(self, target, i, value=v),
+        )
 
 
 class MRGPEN_GreasePencil(PropertyGroup):
@@ -2489,6 +4372,18 @@ classes = [
     MRGPEN_OT_remove_layer_filter,
     MRGPEN_OT_edit_layer_or_material,
     MRGPEN_OT_pick_sample_length,
+    MRGPEN_OT_resample_strokes,
+    MRGPEN_OT_simplify_strokes,
+    MRGPEN_OT_clean_up_strokes,
+]
+
+# 選択情報のキャッシュを破棄するハンドラ
+data_update_handlers = [
+    bpy.app.handlers.depsgraph_update_post,
+    bpy.app.handlers.frame_change_post,
+    bpy.app.handlers.undo_post,
+    bpy.app.handlers.redo_post,
+    bpy.app.handlers.load_post,
 ]
 
 def register():
@@ -2499,8 +4394,17 @@ def register():
     bpy.types.WindowManager.mrgpen = PointerProperty(type=MRGPEN_WindowManager)
     bpy.types.GreasePencil.mrgpen = PointerProperty(type=MRGPEN_GreasePencil)
 
+    for x in data_update_handlers:
+        x.append(on_data_update)
+
 
 def unregister():
+    for x in data_update_handlers:
+        if on_data_update in x:
+            x.remove(on_data_update)
+
+    invalidate_selection_index()
+
     translations.unregister(__name__)
 
     for x in classes: